@@ -1,28 +1,52 @@
 
-import os, re
-import json, time, uuid
+import os, io, hmac, atexit
+import time, uuid, operator
+import orjson
+import queue, sqlite3, threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from flask import Flask, request, abort, jsonify
+from itertools import islice
+from flask import Flask, Response, request, abort
 from linebot import LineBotApi, WebhookHandler
 from linebot.exceptions import InvalidSignatureError, LineBotApiError
 from linebot.models import MessageEvent, TextMessage, TextSendMessage
+from linebot.http_client import RequestsHttpClient, RequestsHttpResponse
+import requests
 
-# ====== 快取區（會隨 Render 睡眠清空）======
+# ====== 快取區（會隨 Render 睡眠清空，另存快照到 /tmp 的 SQLite 讓重啟後能直接接回）======
 TRACKS_CACHE = {}
 LAST_SHEET_LOAD_TIME = 0
 CACHE_TTL_SECONDS = 86400  # 每天更新一次
+# 表上紀錄回放後的結果（user_id → 代號清單）；None 表示不知道表上現況
+_SHEET_STATE: dict[str, list[str]] | None = None
+# 表上每列的 op 欄
+OP_ADD, OP_DEL, OP_CLEAR = "add", "del", "CLEAR"
+# 快取每異動一次 _TRACKS_VERSION +1；寫回表上後 _SAVED_VERSION 追上，兩者不同表示還有異動沒寫回
+_TRACKS_LOCK = threading.RLock()
+_TRACKS_VERSION = 0
+_SAVED_VERSION = 0
+TRACKS_TOTAL_COUNT = 0  # 所有人追蹤的代號總數，給 /meta 用，不必每次加總
+TRACKS_SNAPSHOT_PATH = "/tmp/tracks.db"
+_SHEET_MODIFIED: str | None = None  # 上次讀表時 Drive 上的 modifiedTime，沒變就不用重抓整張表
+# 整份快取過期後，個別使用者單獨從表上重讀的時間（user_id → time.time()）；整張重讀時清空
+_OWNER_LOADED_AT: dict[str, float] = {}
 
 # 服務邏輯（你專案裡的 services 模組）
 from services import (
     # MOPS
     get_today_major_announcements,
+    get_today_major_announcements_bulk,
     get_historical_announcements,
     # Bookbuilding
     get_bookbuilding_announcements,
     # Stocks
     get_stocks_list,
     get_stock_name_by_code,
+    resolve_names_bulk,
     get_stock_code_by_name,
+    suggest_stocks,
+    resolve_stock,
     refresh_stocks,
 )
 
@@ -39,11 +63,40 @@ def _getenv_required(name: str) -> str:
 CHANNEL_ACCESS_TOKEN = _getenv_required("LINE_CHANNEL_ACCESS_TOKEN")
 CHANNEL_SECRET = _getenv_required("LINE_CHANNEL_SECRET")
 
-line_bot_api = LineBotApi(CHANNEL_ACCESS_TOKEN)
+class _SessionHttpClient(RequestsHttpClient):
+    """LINE SDK 預設每次呼叫都用 requests.post 開新連線；改用共用的 Session 保持連線，
+    回覆時不用每次重做 TCP/TLS 握手。"""
+
+    def __init__(self, timeout=RequestsHttpClient.DEFAULT_TIMEOUT):
+        super().__init__(timeout)
+        self.session = requests.Session()
+
+    def get(self, url, headers=None, params=None, stream=False, timeout=None):
+        response = self.session.get(url, headers=headers, params=params, stream=stream,
+                                    timeout=self.timeout if timeout is None else timeout)
+        return RequestsHttpResponse(response)
+
+    def post(self, url, headers=None, data=None, timeout=None):
+        response = self.session.post(url, headers=headers, data=data,
+                                     timeout=self.timeout if timeout is None else timeout)
+        return RequestsHttpResponse(response)
+
+    def put(self, url, headers=None, data=None, timeout=None):
+        response = self.session.put(url, headers=headers, data=data,
+                                    timeout=self.timeout if timeout is None else timeout)
+        return RequestsHttpResponse(response)
+
+    def delete(self, url, headers=None, data=None, timeout=None):
+        response = self.session.delete(url, headers=headers, data=data,
+                                       timeout=self.timeout if timeout is None else timeout)
+        return RequestsHttpResponse(response)
+
+line_bot_api = LineBotApi(CHANNEL_ACCESS_TOKEN, http_client=_SessionHttpClient)
 handler = WebhookHandler(CHANNEL_SECRET)
 
 # ====== 維護模式 & 冷啟動 ======
 MAINTENANCE_MODE = os.environ.get("MAINTENANCE_MODE", "false").lower() == "true"
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")  # /compact 用；沒設定就不開放
 BOOT_ID = os.environ.get("BOOT_ID") or str(uuid.uuid4())
 START_TS = time.time()
 
@@ -55,58 +108,490 @@ def is_cold_start(threshold: float = 30.0) -> bool:
 
 # ====== 追蹤清單（JSON 僅存代號） ======
 import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+from google.oauth2.service_account import Credentials
 
 SHEET_ID = "1guRGoBrCtqcbqZq4Z4nxyCHmYTNYjnrXrgGCKL8xdn0"  
+SHEET_KEYFILE = "/etc/secrets/conductive-coil-441304-n8-ccb680eb2dda.json"
+SHEET_SCOPE = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+
+def _open_sheet():
+    global _CREDS, _GC
+    # 金鑰檔只讀一次；之後 token 到期由 gspread 的 AuthorizedSession 自動更新
+    _CREDS = Credentials.from_service_account_file(SHEET_KEYFILE, scopes=SHEET_SCOPE)
+    _GC = gspread.authorize(_CREDS)
+    return _GC.open_by_key(SHEET_ID).sheet1
+
+# 連線在第一次 get_sheet() 時才建立；冷啟動由 _warm_up 在背景先建好，import 不用等授權
+_SHEET_LOCK = threading.Lock()
+_CREDS = _GC = _SHEET = None
 
 def get_sheet():
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_name("/etc/secrets/conductive-coil-441304-n8-ccb680eb2dda.json", scope)
-    client = gspread.authorize(creds)
-    return client.open_by_key(SHEET_ID).sheet1
+    global _SHEET
+    if _SHEET is None:
+        with _SHEET_LOCK:  # 多個執行緒同時遇到沒有連線時只建一次
+            if _SHEET is None:
+                _SHEET = _open_sheet()
+    return _SHEET
+
+def _reset_sheet(stale):
+    global _SHEET
+    with _SHEET_LOCK:
+        if _SHEET is stale:  # 別的執行緒已經重建過就不用再丟掉
+            _SHEET = None
+
+def _sheet_call(fn):
+    """用共用的 sheet 執行 fn(sheet)；遇到 401（憑證失效）重新授權後再試一次。"""
+    sheet = get_sheet()
+    try:
+        return fn(sheet)
+    except gspread.exceptions.APIError as e:
+        if getattr(e.response, "status_code", None) != 401:
+            raise
+        _reset_sheet(sheet)
+        return fn(get_sheet())
+
+# 本機快照：tracks 表存「表上現況」的每人每檔一列（rowid 保留加入順序），
+# meta 存快照時間與表上現況是否已知。WAL 模式下增刪只寫異動的列，不必整份重寫。
+_SNAPSHOT_LOCK = threading.Lock()
+_SNAPSHOT_DB: sqlite3.Connection | None = None
+
+def _snapshot_db() -> sqlite3.Connection:
+    """取得快照連線（第一次用到才建表），呼叫端要持有 _SNAPSHOT_LOCK。"""
+    global _SNAPSHOT_DB
+    if _SNAPSHOT_DB is None:
+        db = sqlite3.connect(TRACKS_SNAPSHOT_PATH, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")  # 快照掉了頂多重讀一次表，不需要每筆都 fsync
+        db.execute("CREATE TABLE IF NOT EXISTS tracks (owner TEXT NOT NULL, code TEXT NOT NULL, UNIQUE (owner, code))")
+        db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+        _SNAPSHOT_DB = db
+    return _SNAPSHOT_DB
+
+def _snapshot_meta(db: sqlite3.Connection, sheet_known: bool, loaded_at: float | None = None):
+    db.executemany(
+        "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+        [("loaded_at", time.time() if loaded_at is None else loaded_at), ("sheet_known", int(sheet_known))],
+    )
+
+def _write_snapshot(tracks: dict, sheet_known: bool, loaded_at: float | None = None):
+    """整份重寫本機快照（讀表或整張重寫表格後用）；同一個交易內完成，不會讀到寫一半的快照。
+    loaded_at 是快照時間（上次整張讀表的時間），沒給就是現在。"""
+    rows = [(uid, code) for uid, codes in tracks.items() for code in codes]
+    try:
+        with _SNAPSHOT_LOCK:
+            db = _snapshot_db()
+            with db:
+                db.execute("DELETE FROM tracks")
+                db.executemany("INSERT OR IGNORE INTO tracks VALUES (?, ?)", rows)
+                _snapshot_meta(db, sheet_known, loaded_at)
+    except sqlite3.Error as e:
+        print(f"[快照寫入失敗] {e}")
+
+def _update_snapshot(added: list, removed: list, cleared: list, touch: bool = True) -> bool:
+    """只把這次的異動套到快照：added / removed 是 (user_id, 代號)，cleared 是被清空的 user_id。
+    touch=False 時不更新快照時間（只重讀了部分使用者，不代表整份是新的）。"""
+    try:
+        with _SNAPSHOT_LOCK:
+            db = _snapshot_db()
+            with db:
+                db.executemany("DELETE FROM tracks WHERE owner = ?", [(uid,) for uid in cleared])
+                db.executemany("DELETE FROM tracks WHERE owner = ? AND code = ?", removed)
+                db.executemany("INSERT OR IGNORE INTO tracks VALUES (?, ?)", added)
+                if touch:
+                    _snapshot_meta(db, True)
+        return True
+    except sqlite3.Error as e:
+        print(f"[快照更新失敗] {e}")
+        return False
+
+def _read_snapshot():
+    """啟動時讀回本機快照，快照時間視為上次讀表時間，沒過 TTL 就不用打 Google Sheet。"""
+    global TRACKS_CACHE, LAST_SHEET_LOAD_TIME, _SHEET_STATE, TRACKS_TOTAL_COUNT
+    tracks = defaultdict(list)
+    try:
+        with _SNAPSHOT_LOCK:
+            db = _snapshot_db()
+            meta = dict(db.execute("SELECT key, value FROM meta"))
+            if "loaded_at" not in meta:
+                return
+            for uid, code in db.execute("SELECT owner, code FROM tracks ORDER BY rowid"):
+                tracks[uid].append(code)
+    except sqlite3.Error as e:
+        print(f"[快照讀取失敗] {e}")
+        return
+    TRACKS_CACHE = dict(tracks)
+    _SHEET_STATE = {uid: list(codes) for uid, codes in tracks.items()} if meta.get("sheet_known") else None
+    LAST_SHEET_LOAD_TIME = meta["loaded_at"]
+    TRACKS_TOTAL_COUNT = sum(len(v) for v in TRACKS_CACHE.values())
+
+def _sheet_last_update() -> str | None:
+    """向 Drive 查試算表的 modifiedTime（只拿一個欄位，比抓整張表便宜很多）；失敗回傳 None。"""
+    try:
+        return _sheet_call(lambda sheet: sheet.spreadsheet.get_lastUpdateTime())
+    except Exception as e:
+        print(f"[查詢表格更新時間失敗] {e}")
+        return None
+
+def _replay_rows(rows: list[list[str]]) -> tuple[dict, bool]:
+    """依序回放表上的紀錄列（第一列是表頭）：add 加入、del 移除、CLEAR 清空該使用者。
+    回傳 (user_id → 代號清單, 表頭有沒有 op 欄)。"""
+    replay = defaultdict(dict)  # user_id → 有序集合（只用 dict 的 key）
+
+    header = rows[0]
+    idx_user = header.index("user_id")
+    idx_code = header.index("stock_code")
+    idx_op = header.index("op") if "op" in header else None  # 舊表沒有 op 欄，每列都當 add
+
+    codes_of = replay.__getitem__  # 比 setdefault 少一次查找，也不用每列先建空 dict
+    for row in islice(rows, 1, None):
+        uid = row[idx_user]
+        if not uid:
+            continue
+        op = row[idx_op] if idx_op is not None else OP_ADD
+        if op == OP_CLEAR:
+            codes_of(uid).clear()
+            continue
+        code = row[idx_code]  # get_all_values 一律回傳字串
+        if len(code) < 4:
+            code = code.zfill(4)
+        if op == OP_DEL:
+            codes_of(uid).pop(code, None)
+        else:
+            codes_of(uid)[code] = None
+    return {uid: list(codes) for uid, codes in replay.items()}, idx_op is not None
 
 def load_tracks(force_reload=False) -> dict:
-    global TRACKS_CACHE, LAST_SHEET_LOAD_TIME
+    """讀表並依序回放紀錄：add 加入、del 移除、CLEAR 清空該使用者。"""
+    global TRACKS_CACHE, LAST_SHEET_LOAD_TIME, _SHEET_STATE, TRACKS_TOTAL_COUNT, _SHEET_MODIFIED
 
     now = time.time()
     if not force_reload and TRACKS_CACHE and (now - LAST_SHEET_LOAD_TIME < CACHE_TTL_SECONDS):
         return TRACKS_CACHE
+    if _TRACKS_VERSION != _SAVED_VERSION:
+        return TRACKS_CACHE  # 還有異動在背景排隊，不能拿表上的舊資料蓋掉
+
+    # 先查 modifiedTime（要在讀表之前查，讀表途中被改也會在下次發現）
+    modified = _sheet_last_update()
+    if not force_reload and TRACKS_CACHE and modified and modified == _SHEET_MODIFIED:
+        LAST_SHEET_LOAD_TIME = now  # 表沒被動過，快取續命
+        _OWNER_LOADED_AT.clear()
+        return TRACKS_CACHE
+
+    rows = _sheet_call(lambda sheet: sheet.get_all_values())
+    result, has_op = _replay_rows(rows)
+    # 舊表沒有 op 欄時不能直接追加紀錄，標成未知讓下次寫入整張重寫（順便補上 op 欄）
+    sheet_state = {uid: list(codes) for uid, codes in result.items()} if has_op else None
+
+    with _TRACKS_LOCK:
+        if _TRACKS_VERSION != _SAVED_VERSION:
+            return TRACKS_CACHE
+        TRACKS_CACHE = result
+        LAST_SHEET_LOAD_TIME = now
+        _SHEET_STATE = sheet_state
+        _SHEET_MODIFIED = modified
+        TRACKS_TOTAL_COUNT = sum(len(v) for v in result.values())
+        _OWNER_LOADED_AT.clear()
+    _write_snapshot(result, sheet_state is not None)
+    return result
 
-    sheet = get_sheet()
-    rows = sheet.get_all_values()
-    result = {}
 
+def _read_owner_rows(owner: str) -> list[list[str]]:
+    """只讀 owner 自己的紀錄列：先抓 A 欄（user_id）找出列號，再用一次 batch_get 取回那幾列。
+    回傳的第一列是表頭。"""
+    def read(sheet):
+        col = sheet.col_values(1)
+        row_nums = [i for i, uid in enumerate(col, 1) if uid == owner]
+        rows = []
+        # 一次帶太多 range 網址會過長，每 100 列分一批；表頭跟第一批一起拿
+        for i in range(0, max(len(row_nums), 1), 100):
+            ranges = [f"{r}:{r}" for r in row_nums[i:i + 100]]
+            if i == 0:
+                ranges.insert(0, "1:1")
+            rows += [vr[0] if vr else [] for vr in sheet.batch_get(ranges)]
+        return rows
+    return _sheet_call(read)
+
+def load_user_tracks(owner: str) -> list[str]:
+    """取得 owner 的追蹤清單。
+
+    整份快取沒過期時直接回傳快取；過期後不整張重讀，只重讀這位使用者的列並回放，
+    之後同一位使用者在 CACHE_TTL_SECONDS 內都用快取。
+    表上現況不明（冷啟動、舊表沒有 op 欄）時退回 load_tracks() 整張讀。
+    """
+    global _SHEET_STATE, TRACKS_TOTAL_COUNT
+
+    now = time.time()
+    if (
+        (TRACKS_CACHE and now - LAST_SHEET_LOAD_TIME < CACHE_TTL_SECONDS)
+        or now - _OWNER_LOADED_AT.get(owner, 0) < CACHE_TTL_SECONDS
+        or _TRACKS_VERSION != _SAVED_VERSION  # 還有異動沒寫回，快取比表上新
+    ):
+        return TRACKS_CACHE.get(owner, [])
+    if _SHEET_STATE is None:
+        return load_tracks().get(owner, [])
+
+    with _TRACKS_LOCK:
+        version = _TRACKS_VERSION
+    rows = _read_owner_rows(owner)
     header = rows[0]
-    idx_user = header.index("user_id")
     idx_code = header.index("stock_code")
+    idx_op = header.index("op")
+
+    codes = {}  # 有序集合
+    for row in islice(rows, 1, None):
+        op = row[idx_op] if idx_op < len(row) else OP_ADD
+        if op == OP_CLEAR:
+            codes.clear()
+            continue
+        code = row[idx_code] if idx_code < len(row) else ""
+        if len(code) < 4:
+            code = code.zfill(4)
+        if op == OP_DEL:
+            codes.pop(code, None)
+        else:
+            codes[code] = None
+    codes = list(codes)
+
+    with _TRACKS_LOCK:
+        if _TRACKS_VERSION != version or _SHEET_STATE is None:
+            return TRACKS_CACHE.get(owner, [])  # 讀表途中清單又被改過，以快取為準
+        TRACKS_TOTAL_COUNT += len(codes) - len(TRACKS_CACHE.get(owner, ()))
+        TRACKS_CACHE[owner] = codes
+        # 換成新的 dict，背景寫表正在比對舊的那份時才不會被改到
+        _SHEET_STATE = {**_SHEET_STATE, owner: list(codes)}
+        _OWNER_LOADED_AT[owner] = now
+    _update_snapshot([(owner, c) for c in codes], [], [owner], touch=False)
+    return codes
+
+
+def _sheet_row(uid: str, code: str, op: str) -> list[str]:
+    return [uid, f"'{code}" if code else "", op]  # 代號前面強制加 ' 表示純文字格式
+
+
+def _rewrite_sheet(data: dict):
+    """把表整張改寫成每人每檔一列 add（給 compact 跟沒有 op 欄的舊表用）。
+
+    不先 clear 再 append：用一次 update 從 A1 蓋過去，原本比較長的部分填空白列
+    （回放時沒有 user_id 的列會跳過），中途失敗不會留下一張空表；
+    另一個 worker 在這之後追加的紀錄會接在後面，回放時照樣套用。
+    """
+    global _SHEET_STATE
+
+    values = [["user_id", "stock_code", "op"]] + [
+        _sheet_row(uid, code, OP_ADD) for uid, codes in data.items() for code in codes
+    ]
+
+    def rewrite(sheet):
+        old_len = len(sheet.col_values(1))
+        sheet.update(
+            values=values + [["", "", ""]] * (old_len - len(values)),
+            range_name="A1",
+            value_input_option="RAW",
+        )
+    _sheet_call(rewrite)
 
-    for row in rows[1:]:
-        uid = row[idx_user]
-        code_raw = str(row[idx_code])
-        code = code_raw.zfill(max(4, len(code_raw)))
-        result.setdefault(uid, []).append(code)
+    # 寫表不算重新讀表：另一個 worker 的異動這裡沒讀到，不能讓整份快取續命
+    with _TRACKS_LOCK:
+        _SHEET_STATE = data
+    _write_snapshot(data, True, LAST_SHEET_LOAD_TIME)
 
-    TRACKS_CACHE = result
-    LAST_SHEET_LOAD_TIME = now
-    return result
+def save_tracks(data: dict, state: dict | None):
+    """把追蹤清單寫回 Google Sheet。
 
+    表是一份只往後追加的紀錄：跟 _SHEET_STATE（表上回放後的結果）比對，
+    每位使用者被移除的代號追加 del、新增的追加 add、整份清空則追加一列 CLEAR，
+    全部用一次 append_rows 送出，不會重寫既有的列。
+    不知道表上現況（冷啟動時讀表失敗）時先讀表回放拿到現況再比對；
+    只有舊表沒有 op 欄時才整張重寫（順便補上 op 欄）。
 
+    state 是跟 data 在同一次持有 _TRACKS_LOCK 時取得的 _SHEET_STATE；整個比對只看這一份，
+    不會讀到 load_user_tracks 換到一半的全域變數。
 
-def save_tracks(data: dict):
-    global TRACKS_CACHE, LAST_SHEET_LOAD_TIME
+    只負責寫表，不會動到 TRACKS_CACHE；指令處理請用 _commit_tracks 交給背景批次寫入。
+    """
+    global _SHEET_STATE
 
-    sheet = get_sheet()
-    sheet.clear()
-    sheet.append_row(["user_id", "stock_code"])
-    rows = []
-    for uid, codes in data.items():
-        for code in codes:
-            rows.append([uid, f"'{code}"])  # 前面強制加 ' 表示純文字格式
-    sheet.append_rows(rows, value_input_option="RAW")
+    base = state
+    if state is None:
+        state, has_op = _replay_rows(_sheet_call(lambda sheet: sheet.get_all_values()))
+        if not has_op:
+            _rewrite_sheet(data)
+            return
+
+    added, removed, cleared = [], [], []
+    for uid in dict.fromkeys([*data, *state]):
+        old, new = state.get(uid, []), data.get(uid, [])
+        if old == new:
+            continue
+        if not new:
+            cleared.append(uid)
+            continue
+        old_set, new_set = set(old), set(new)
+        removed += [(uid, c) for c in old if c not in new_set]
+        added += [(uid, c) for c in new if c not in old_set]
+    log = (
+        [_sheet_row(uid, "", OP_CLEAR) for uid in cleared]
+        + [_sheet_row(uid, c, OP_DEL) for uid, c in removed]
+        + [_sheet_row(uid, c, OP_ADD) for uid, c in added]
+    )
+    if log:
+        _sheet_call(lambda sheet: sheet.append_rows(
+            log,
+            value_input_option="RAW",
+            insert_data_option="INSERT_ROWS",
+            table_range="A1",
+        ))
+
+    # 只追加了自己的異動，不代表讀到了另一個 worker 寫的；整份快取跟快照的時間都不更新，
+    # 過期後 load_user_tracks 照樣會逐人重讀
+    with _TRACKS_LOCK:
+        new_state = data
+        if _SHEET_STATE is not base and _SHEET_STATE is not None and base is not None:
+            # 寫表途中 load_user_tracks 重讀過某些人（它會換上新的 list），那幾位以重讀的結果為準
+            new_state = {**data, **{
+                uid: codes for uid, codes in _SHEET_STATE.items() if codes is not base.get(uid)
+            }}
+        _SHEET_STATE = new_state
+    if not _update_snapshot(added, removed, cleared, touch=False):
+        _write_snapshot(data, True, LAST_SHEET_LOAD_TIME)  # 增量寫入失敗時整份重寫，確保快照跟表上一致
+
+
+# ====== 背景批次寫入 ======
+class _FlushRequest:
+    """放進 AsyncBatcher 佇列的記號：處理到這裡時設定 done，ok 表示前面的項目是否都寫成功。"""
+    __slots__ = ("done", "ok")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.ok = False
+
+
+class AsyncBatcher:
+    """背景執行緒收集丟進來的項目，湊滿 max_batch_size 筆或等滿 max_queue_time 秒後
+    一次交給 process_batch 處理。process() 只是放進佇列，不會卡住呼叫端。
+
+    process_batch 失敗時整批留著，等 retry_delay 秒（連續失敗就加倍，最多 max_retry_delay）
+    後直接重送，不再等 max_queue_time；flush() 會等佇列裡已有的項目處理完，給關機前呼叫。"""
+
+    def __init__(self, process_batch, max_batch_size: int = 50, max_queue_time: float = 2.0,
+                 retry_delay: float = 1.0, max_retry_delay: float = 60.0):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_queue_time = max_queue_time
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._failures = 0
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def process(self, item):
+        self._queue.put(item)
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """等目前佇列裡的項目都送出去（最多 timeout 秒）；回傳是否在時間內都處理成功。
+        前面的批次失敗時立刻回傳 False，那一批留在背景繼續重試。"""
+        req = _FlushRequest()
+        self._queue.put(req)
+        return req.done.wait(timeout) and req.ok
+
+    def _collect(self, batch: list) -> tuple[list, list[_FlushRequest]]:
+        """從佇列取項目接在 batch 後面。batch 是空的才等 max_queue_time 湊批次；
+        要重試的批次只順便帶上已經在排隊的項目，不再等。"""
+        flushes = []
+        if batch:
+            deadline = time.monotonic()
+        else:
+            item = self._queue.get()
+            if isinstance(item, _FlushRequest):
+                return batch, [item]
+            batch.append(item)
+            deadline = time.monotonic() + self.max_queue_time
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, _FlushRequest):
+                flushes.append(item)  # 有人在等 flush，不再湊批次，立刻送出
+                break
+            batch.append(item)
+        return batch, flushes
+
+    def _run(self):
+        retry = []
+        while True:
+            batch, flushes = self._collect(retry)
+            ok, delay = True, 0
+            if batch:
+                try:
+                    self.process_batch(batch)
+                    self._failures = 0
+                    retry = []
+                except Exception as e:
+                    ok = False
+                    self._failures += 1
+                    delay = min(self.retry_delay * 2 ** (self._failures - 1), self.max_retry_delay)
+                    print(f"[批次處理失敗] {len(batch)} 筆，{delay:g} 秒後重試：{e}")
+                    retry = batch
+            for req in flushes:  # 這批真的寫成功才算 flush 完成
+                req.ok = ok
+                req.done.set()
+            if not ok:
+                time.sleep(delay)
+
+
+def _flush_tracks(mutations: list[dict]):
+    """把這一批異動合併成一次 save_tracks。異動本身已由 _commit_tracks 套進快取，
+    這裡只要拿快取的快照寫表。
+
+    寫表失敗時 _SHEET_STATE 維持原樣（append_rows 是一次呼叫，失敗就是整批沒寫進去），
+    AsyncBatcher 重試時會再比對出同一份差異。
+    批次裡有 {"compact": True} 時，先照常寫完這批異動，再交給 _compact_sheet。
+    """
+    global _SAVED_VERSION
+
+    with _TRACKS_LOCK:
+        version = _TRACKS_VERSION
+        snapshot = {uid: list(codes) for uid, codes in TRACKS_CACHE.items()}
+        state = _SHEET_STATE  # 跟快照同時取，兩份才對得起來
+    save_tracks(snapshot, state)
+    with _TRACKS_LOCK:
+        _SAVED_VERSION = version
+
+    if any(m.get("compact") for m in mutations):
+        _compact_sheet()
+
+
+def _compact_sheet():
+    """重新讀表回放（包含另一個 worker 追加的紀錄），再整張改寫成每人每檔一列。"""
+    load_tracks(force_reload=True)
+    with _TRACKS_LOCK:
+        if _TRACKS_VERSION != _SAVED_VERSION:
+            # 讀表途中又有新異動，快取跟表上對不起來；排到下一批再壓縮
+            _TRACKS_BATCHER.process({"compact": True})
+            return
+        snapshot = {uid: list(codes) for uid, codes in TRACKS_CACHE.items()}
+    _rewrite_sheet(snapshot)
 
-    # 更新快取
-    TRACKS_CACHE = data
-    LAST_SHEET_LOAD_TIME = time.time()
+
+_TRACKS_BATCHER = AsyncBatcher(_flush_tracks, max_batch_size=50, max_queue_time=2.0)
+# worker 關閉前把還在排隊的異動寫回表上，不然使用者看到「已加入」的項目會在重啟後消失
+@atexit.register
+def _flush_tracks_on_exit():
+    if not _TRACKS_BATCHER.flush():
+        print("[追蹤清單] 關機前仍有異動沒寫回 Google Sheet")
+
+
+def _commit_tracks(owner: str, codes: list[str], added=(), removed=()):
+    """更新 owner 的追蹤清單快取，並排入背景寫回 Google Sheet。"""
+    global _TRACKS_VERSION, TRACKS_TOTAL_COUNT
+
+    with _TRACKS_LOCK:
+        TRACKS_TOTAL_COUNT += len(codes) - len(TRACKS_CACHE.get(owner, ()))
+        TRACKS_CACHE[owner] = codes
+        _TRACKS_VERSION += 1
+    _TRACKS_BATCHER.process({"owner": owner, "add": list(added), "del": list(removed)})
 
 
 
@@ -114,20 +599,29 @@ def save_tracks(data: dict):
 
 # ====== 工具 ======
 
+# 分隔符號全部換成空白，再交給 str.split() 處理連續空白（含全形空白、換行）
+_SEP_TRANS = str.maketrans({c: " " for c in ",，、；;"})
+
 def _split_symbols(s: str) -> list[str]:
     """
     把使用者輸入切成多個 token：
     支援空白、逗號、全形逗號、頓號、分號、換行等。
     例：'2330 台積電,0050；0056\n聯發科' -> ['2330','台積電','0050','0056','聯發科']
     """
-    return [t.strip() for t in re.split(r"[,\s，、；;]+", s) if t.strip()]
+    return s.translate(_SEP_TRANS).split()
+
+_NO_TEXT = "（查無資料或發生未知錯誤）"
 
 def _ensure_text(s) -> str:
+    if type(s) is str:  # 絕大多數欄位本來就是字串，不用再轉型
+        return s.strip() or _NO_TEXT
+    if s is None:
+        return _NO_TEXT
     try:
-        s = ("" if s is None else str(s)).strip()
+        s = str(s).strip()
     except Exception:
-        s = "（查無資料或發生未知錯誤）"
-    return s or "（查無資料或發生未知錯誤）"
+        return _NO_TEXT
+    return s or _NO_TEXT
 
 def _owner_id(event: MessageEvent) -> str:
     """在 1:1 / 群組 / 聊天室下都能得到一個穩定 key。"""
@@ -140,6 +634,9 @@ def _owner_id(event: MessageEvent) -> str:
         return f"room:{src.room_id}"
     return "unknown"
 
+# 公告 dict 一律帶有這三個欄位（見 services.mops_service）
+_get_row = operator.itemgetter("name", "subject", "date_pub")
+
 def _fmt_rows(rows: list[dict], max_chars: int = 4800) -> tuple[str, bool]:
     """
     將公告格式化為多筆訊息，每則格式如下：
@@ -149,44 +646,48 @@ def _fmt_rows(rows: list[dict], max_chars: int = 4800) -> tuple[str, bool]:
     max_chars：限制最大字數（避免超過 LINE 限制）
     回傳 tuple: (格式化後字串, 是否有被截斷)
     """
-    out = []
+    buf = io.StringIO()
     total_len = 0
     for x in rows:
-        name = _ensure_text(x.get("name"))
-        subject = _ensure_text(x.get("subject"))
-        date_pub = _ensure_text(x.get("date_pub"))
-        msg = f"【{name}】{subject}\n📅 公告日：{date_pub}"
-        if total_len + len(msg) + 2 > max_chars:  # +2 是換行符號
-            return ("\n\n".join(out), True)
-        out.append(msg)
-        total_len += len(msg) + 2
-    return ("\n\n".join(out), False)
+        name, subject, date_pub = map(_ensure_text, _get_row(x))
+        msg = f"【{name}】{subject}\n📅 公告日：{date_pub}\n\n"  # 結尾兩個換行當分隔
+        total_len += len(msg)
+        if total_len > max_chars:
+            return (buf.getvalue()[:-2], True)
+        buf.write(msg)
+    return (buf.getvalue()[:-2], False)
+
+_get_bookbuild_row = operator.itemgetter("序號", "發行公司", "圈購期間", "價格")
 
 def _fmt_bookbuild_rows(rows: list[dict], max_chars: int = 4800) -> tuple[str, bool]:
-    out = []
+    buf = io.StringIO()
     total_len = 0
     truncated = False
 
     for r in rows:
-        seq = _ensure_text(r.get("序號"))
-        company = _ensure_text(r.get("發行公司"))
-        period = _ensure_text(r.get("圈購期間"))
-        price = _ensure_text(r.get("價格"))
+        seq, company, period, price = map(_ensure_text, _get_bookbuild_row(r))
 
-        line = f"📌 {seq} {company}\n📅 圈購期間：{period}\n💰 價格區間：{price}"
-        if total_len + len(line) + 2 > max_chars:
+        line = f"📌 {seq} {company}\n📅 圈購期間：{period}\n💰 價格區間：{price}\n\n"
+        total_len += len(line)
+        if total_len > max_chars:
             truncated = True
             break
-        out.append(line)
-        total_len += len(line) + 2
+        buf.write(line)
 
-    return "\n\n".join(out), truncated
+    return buf.getvalue()[:-2], truncated
 
 _TPE = timezone(timedelta(hours=8))
 def _roc_date(d: datetime.date) -> str:
     y = d.year - 1911
     return f"{y:03d}/{d.month:02d}/{d.day:02d}"
 
+def _parse_roc_date(s: str) -> datetime:
+    """民國日期字串（114/08/01，年/月/日位數可不固定）轉 datetime；格式錯誤會拋 ValueError。"""
+    s = s.strip()
+    i = s.index("/")
+    j = s.rindex("/")
+    return datetime(int(s[:i]) + 1911, int(s[i + 1:j]), int(s[j + 1:]))
+
 def _taipei_today():
     return datetime.now(tz=_TPE).date()
 
@@ -194,26 +695,39 @@ def resolve_to_code_and_name(token: str) -> tuple[str | None, str | None]:
     token = (token or "").strip()
     if not token:
         return None, None
+    # 代號與名稱共用一張對照表，查詢在 services 端都有快取，refresh_stocks 時會一起清掉
+    return resolve_stock(token)
+
+def _with_suggestions(token: str, limit: int = 3) -> str:
+    """未辨識的輸入附上名稱開頭相符的候選股票。"""
     if token.isdigit():
-        name = get_stock_name_by_code(token)
-        return (token, name) if name else (None, None)
-    code = get_stock_code_by_name(token)
-    if not code:
-        return None, None
-    name = get_stock_name_by_code(code) or token
-    return code, name
+        return token
+    hints = "、".join(f"{code} {name}" for name, code in suggest_stocks(token, limit))
+    return f"{token}（可能是：{hints}）" if hints else token
 
 # ====== 健康檢查 ======
 @app.get("/meta")
 def meta():
-    tracks = load_tracks()
-    return jsonify({
+    # 平常只讀記憶體裡的計數，不碰 Google Sheet；?fresh=1 才強制重新讀表
+    if request.args.get("fresh"):
+        load_tracks(force_reload=True)
+    payload = {
         "boot_id": BOOT_ID,
         "uptime_sec": round(uptime_seconds(), 3),
         "cold_start_guess": is_cold_start(),
-        "tracks_size": sum(len(v) for v in tracks.values()) if isinstance(tracks, dict) else 0,
+        "tracks_size": TRACKS_TOTAL_COUNT,
         "python_version": os.sys.version,
-    }), 200
+    }
+    return Response(orjson.dumps(payload), mimetype="application/json"), 200
+
+@app.post("/compact")
+def compact():
+    """把表上累積的 add/del/CLEAR 紀錄整理成每人每檔一列（交給背景執行緒做，給每日排程呼叫）。"""
+    token = request.headers.get("X-Admin-Token", "")
+    if not ADMIN_TOKEN or not hmac.compare_digest(token, ADMIN_TOKEN):
+        abort(403)
+    _TRACKS_BATCHER.process({"compact": True})
+    return "queued", 202
 
 @app.get("/")
 def health():
@@ -224,16 +738,272 @@ def healthz():
     return "ok", 200
 
 # ====== LINE Webhook ======
+# 事件改在背景執行緒處理，webhook 驗完簽就先回 200，不用等回覆 LINE 的 HTTPS 往返
+_EVENT_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="line-event")
+
+def _handle_webhook(body: str, signature: str):
+    try:
+        handler.handle(body, signature)
+    except Exception as e:
+        print(f"[webhook 處理失敗] {e}")
+
 @app.post("/callback")
 def callback():
     signature = request.headers.get("X-Line-Signature", "")
     body = request.get_data(as_text=True)
     try:
-        handler.handle(body, signature)
+        handler.parser.parse(body, signature)  # 只驗簽，簽章錯誤要當場回 400
     except InvalidSignatureError:
         abort(400)
+    _EVENT_POOL.submit(_handle_webhook, body, signature)
     return "OK", 200
 
+# ====== 文字指令 ======
+# 每個指令一個函式，簽名一律是 (owner, arg, reply)：arg 是指令後面的文字（已去頭尾空白）
+
+def _cmd_add(owner: str, arg: str, reply):
+    """追蹤清單：add（支援多個）"""
+    items = _split_symbols(arg)
+    if not items:
+        reply("用法：add 2330 台積電 0050（可一次多個）")
+        return
+
+    my_codes = dict.fromkeys(load_user_tracks(owner))  # 保留順序，成員檢查 O(1)
+
+    added, skipped, unknown = [], [], []
+    added_codes = []
+
+    for tok in items:
+        code, name = resolve_to_code_and_name(tok)
+        if not code:
+            unknown.append(_with_suggestions(tok))
+            continue
+        display = f"{code} {name or ''}".strip()
+        if code in my_codes:  # 已在清單或同批重覆
+            skipped.append(display)
+            continue
+        my_codes[code] = None
+        added.append(display)
+        added_codes.append(code)
+
+    if added_codes:  # 全部已在清單或無法辨識時不用寫表
+        _commit_tracks(owner, list(my_codes), added=added_codes)
+
+    parts = []
+    if added:
+        parts.append("✅ 已加入：\n" + "\n".join(f"• {x}" for x in added))
+    if skipped:
+        parts.append("↪️ 已在清單：\n" + "\n".join(f"• {x}" for x in skipped))
+    if unknown:
+        parts.append("❓ 未辨識：\n" + "\n".join(f"• {x}" for x in unknown))
+    reply("\n\n".join(parts) or "沒有可加入的項目")
+
+
+def _cmd_del(owner: str, arg: str, reply):
+    """追蹤清單：del（支援多個）"""
+    items = _split_symbols(arg)
+    if not items:
+        reply("用法：del 2330 台積電 0050（可一次多個）")
+        return
+
+    my_codes = dict.fromkeys(load_user_tracks(owner))  # 保留順序，刪除 O(1)
+
+    removed, notfound = [], []
+    removed_codes = []
+
+    for tok in items:
+        code, name = resolve_to_code_and_name(tok)
+        if not code:
+            notfound.append(_with_suggestions(tok))
+            continue
+        display = f"{code} {name or ''}".strip()
+        if code in my_codes:
+            del my_codes[code]
+            removed.append(display)
+            removed_codes.append(code)
+        else:
+            notfound.append(display)
+
+    if removed_codes:
+        _commit_tracks(owner, list(my_codes), removed=removed_codes)
+
+    parts = []
+    if removed:
+        parts.append("🗑 已刪除：\n" + "\n".join(f"• {x}" for x in removed))
+    if notfound:
+        parts.append("🔍 清單中沒有/無法辨識：\n" + "\n".join(f"• {x}" for x in notfound))
+    reply("\n\n".join(parts) or "沒有可刪除的項目")
+
+
+def _cmd_ls(owner: str, arg: str, reply):
+    """追蹤清單：ls"""
+    my_codes = list(load_user_tracks(owner))
+    if not my_codes:
+        reply("你的追蹤清單為空。\n用法：add 台積電 或 add 2330")
+        return
+    names = resolve_names_bulk(my_codes)
+    lines = [f"{c} {names.get(c) or '（未知名稱）'}" for c in my_codes]
+    reply("追蹤清單：\n" + "\n".join(lines))
+
+
+def _cmd_clear(owner: str, arg: str, reply):
+    """追蹤清單：clear"""
+    my_codes = load_user_tracks(owner)
+    if my_codes:
+        _commit_tracks(owner, [], removed=my_codes)
+    reply("已清空你的追蹤清單。")
+
+
+def _cmd_today(owner: str, arg: str, reply):
+    """公告查詢（今日）"""
+    my_codes = list(load_user_tracks(owner))
+    if not my_codes:
+        reply("清單是空的。先用：add 台積電 或 add 2330")
+        return
+    names = resolve_names_bulk(my_codes)
+    keywords = [names.get(code) or code for code in my_codes]
+    results = get_today_major_announcements_bulk(keywords)  # 整批只打一次 API
+    # 全部股票的公告合併後一次排版，截斷以整則回覆的長度為準
+    all_rows = [r for kw in keywords for r in results[kw]]
+    msg, truncated = _fmt_rows(all_rows, max_chars=4800)
+    if truncated:
+        msg += "\n\n📎 更多公告請參考公開資訊觀測站：\n🔗 https://mops.twse.com.tw"
+    reply("📣 今日公告：\n\n" + (msg or "今日查無資料"))
+
+
+def _cmd_yesterday(owner: str, arg: str, reply):
+    """公告查詢（昨日）"""
+    my_codes = list(load_user_tracks(owner))
+    if not my_codes:
+        reply("清單是空的。先用：add 台積電 或 add 2330")
+        return
+
+    y = _taipei_today() - timedelta(days=1)
+    s = _roc_date(y)
+    names = resolve_names_bulk(my_codes)
+    keywords = [names.get(code) or code for code in my_codes]
+    all_rows = get_historical_announcements(s, s, subjects=keywords)  # 整批只查一次
+
+    msg, truncated = _fmt_rows(all_rows, max_chars=4800)
+    if truncated:
+        msg += "\n\n📎 顯示不完，請至公開資訊觀測站查閱：\n🔗 https://mops.twse.com.tw"
+
+    reply("🗓 昨日公告：\n\n" + msg)
+
+
+def _cmd_mops_today(owner: str, arg: str, reply):
+    rows = get_today_major_announcements(arg)
+    msg, truncated = _fmt_rows(rows, max_chars=4800)
+    if not msg.strip():
+        msg = "今日查無資料"
+    elif truncated:
+        msg += "\n\n📎 更多公告請參考公開資訊觀測站：\n🔗 https://mops.twse.com.tw"
+    reply(msg)
+
+
+def _cmd_mops_range(owner: str, arg: str, reply):
+    parts = arg.split()
+    if len(parts) < 2:
+        reply("用法：mops range 114/08/01 114/08/31 [關鍵字]")
+        return
+    sdate, edate = parts[0], parts[1]
+    subject = " ".join(parts[2:])
+
+    if not subject:
+        reply("請提供查詢關鍵字，例如公司名稱或主旨內容\n用法：mops range 114/08/01 114/08/31 台積電")
+        return
+
+    # 限制區間
+    try:
+        start = _parse_roc_date(sdate)
+        end = _parse_roc_date(edate)
+        if (end - start).days > 90:
+            reply("查詢區間最多支援 90 天，請縮短日期範圍")
+            return
+    except:
+        reply("日期格式錯誤，請用 114/08/01 格式")
+        return
+
+    rows = get_historical_announcements(sdate, edate, subject=subject)
+    msg, truncated = _fmt_rows(rows, max_chars=4800)
+    if truncated:
+        msg += "\n\n📎 顯示不完，請至公開資訊觀測站查閱：\n🔗 https://mops.twse.com.tw"
+    reply(msg or "無資料")
+
+
+def _cmd_book(owner: str, arg: str, reply):
+    rows = get_bookbuilding_announcements()
+    msg, truncated = _fmt_bookbuild_rows(rows)
+    if not msg.strip():
+        msg = "查無詢圈公告"
+    elif truncated:
+        msg += "\n\n📎 更多請參考公開資訊觀測站：\n🔗 https://mops.twse.com.tw"
+    reply(f"📦 詢圈資訊：\n\n{msg}")
+
+
+def _cmd_stock_name(owner: str, arg: str, reply):
+    reply(get_stock_name_by_code(arg) or "查無此代號")
+
+
+def _cmd_stock_code(owner: str, arg: str, reply):
+    reply(get_stock_code_by_name(arg) or "查無此名稱")
+
+
+HELP_TEXT = (
+    "可用指令：\n"
+    "1) add <股票代號或名稱>\n"
+    "2) del <股票代號或名稱>\n"
+    "3) ls\n"
+    "4) clear\n"
+    "5) 爬取今日數據\n"
+    "6) 爬取昨日數據\n"
+    "其他：\n"
+    "• mops today [關鍵字]\n"
+    "• mops range 114/08/01 114/08/31 [關鍵字]\n"
+    "• book\n"
+    "• stock name 2330 / stock code 台積電"
+)
+
+# (指令開頭, 是否要整句完全相符, 處理函式)；比對一律用小寫
+_COMMANDS = [
+    ("add ", False, _cmd_add),
+    ("del ", False, _cmd_del),
+    ("ls", True, _cmd_ls),
+    ("clear", True, _cmd_clear),
+    ("爬取今日數據", True, _cmd_today),
+    ("爬取昨日數據", True, _cmd_yesterday),
+    ("mops today", False, _cmd_mops_today),
+    ("mops range", False, _cmd_mops_range),
+    ("book", False, _cmd_book),
+    ("stock name", False, _cmd_stock_name),
+    ("stock code", False, _cmd_stock_code),
+]
+
+def _build_dispatch(commands) -> dict:
+    """把指令開頭建成逐字的 dict-of-dicts trie，節點的 None 鍵存 (exact, 處理函式)。"""
+    root: dict = {}
+    for prefix, exact, func in commands:
+        node = root
+        for ch in prefix:
+            node = node.setdefault(ch, {})
+        node[None] = (exact, func)
+    return root
+
+_DISPATCH = _build_dispatch(_COMMANDS)
+
+def _match_command(text: str):
+    """沿 trie 走一遍 text，回傳最長相符的 (指令長度, 處理函式)，沒有相符則 None。"""
+    node, best = _DISPATCH, None
+    for i, ch in enumerate(text, 1):
+        node = node.get(ch)
+        if node is None:
+            break
+        entry = node.get(None)
+        if entry and (not entry[0] or i == len(text)):
+            best = (i, entry[1])
+    return best
+
+
 # ====== 處理文字訊息 ======
 @handler.add(MessageEvent, message=TextMessage)
 def handle_message(event: MessageEvent):
@@ -263,224 +1033,31 @@ def handle_message(event: MessageEvent):
         return
 
     try:
-        # === 追蹤清單：add（支援多個） ===
-        if t.lower().startswith("add "):
-            raw = t[4:].strip()
-            items = _split_symbols(raw)
-            if not items:
-                reply("用法：add 2330 台積電 0050（可一次多個）")
-                return
-
-            tracks = load_tracks()
-            my_codes = list(tracks.get(owner, []))
-
-            added, skipped, unknown = [], [], []
-
-            for tok in items:
-                code, name = resolve_to_code_and_name(tok)
-                if not code:
-                    unknown.append(tok)
-                    continue
-                display = f"{code} {name or ''}".strip()
-                if code in my_codes or display in added:  # 已在清單或同批重覆
-                    skipped.append(display)
-                    continue
-                my_codes.append(code)
-                added.append(display)
-
-            tracks[owner] = my_codes
-            save_tracks(tracks)
-
-            parts = []
-            if added:
-                parts.append("✅ 已加入：\n" + "\n".join(f"• {x}" for x in added))
-            if skipped:
-                parts.append("↪️ 已在清單：\n" + "\n".join(f"• {x}" for x in skipped))
-            if unknown:
-                parts.append("❓ 未辨識：\n" + "\n".join(f"• {x}" for x in unknown))
-            reply("\n\n".join(parts) or "沒有可加入的項目")
-            return
-
-
-        # === 追蹤清單：del（支援多個） ===
-        if t.lower().startswith("del "):
-            raw = t[4:].strip()
-            items = _split_symbols(raw)
-            if not items:
-                reply("用法：del 2330 台積電 0050（可一次多個）")
-                return
-
-            tracks = load_tracks()
-            my_codes = list(tracks.get(owner, []))
-
-            removed, notfound = [], []
-
-            for tok in items:
-                code, name = resolve_to_code_and_name(tok)
-                if not code:
-                    notfound.append(tok)
-                    continue
-                display = f"{code} {name or ''}".strip()
-                if code in my_codes:
-                    my_codes = [c for c in my_codes if c != code]
-                    removed.append(display)
-                else:
-                    notfound.append(display)
-
-            tracks[owner] = my_codes
-            save_tracks(tracks)
-
-            parts = []
-            if removed:
-                parts.append("🗑 已刪除：\n" + "\n".join(f"• {x}" for x in removed))
-            if notfound:
-                parts.append("🔍 清單中沒有/無法辨識：\n" + "\n".join(f"• {x}" for x in notfound))
-            reply("\n\n".join(parts) or "沒有可刪除的項目")
-            return
-
-        # === 追蹤清單：ls ===
-        if t.lower() == "ls":
-            tracks = load_tracks()
-            my_codes = list(tracks.get(owner, []))
-            if not my_codes:
-                reply("你的追蹤清單為空。\n用法：add 台積電 或 add 2330")
-            else:
-                lines = []
-                for code in my_codes:
-                    name = get_stock_name_by_code(code) or "（未知名稱）"
-                    lines.append(f"{code} {name}")
-                reply("追蹤清單：\n" + "\n".join(lines))
-            return
-
-        # === 追蹤清單：clear ===
-        if t.lower() == "clear":
-            tracks = load_tracks()
-            tracks[owner] = []
-            save_tracks(tracks)
-            reply("已清空你的追蹤清單。")
-            return
-
-        # === 公告查詢（今日） ===
-        if t == "爬取今日數據":
-                tracks = load_tracks()
-                my_codes = list(tracks.get(owner, []))
-                if not my_codes:
-                    reply("清單是空的。先用：add 台積電 或 add 2330")
-                    return
-                blocks = []
-                for code in my_codes:
-                    name = get_stock_name_by_code(code) or code
-                    rows = get_today_major_announcements(name)
-                    block_text, truncated = _fmt_rows(rows)  # 你已經有支援這個格式
-                    if truncated:
-                        block_text += "\n\n📎 更多公告請參考公開資訊觀測站：\n🔗 https://mops.twse.com.tw"
-                    blocks.append(block_text)
-                reply("📣 今日公告：\n" + "\n\n".join(blocks))
-                return
-
-
-        # === 公告查詢（昨日） ===
-        if t == "爬取昨日數據":
-            tracks = load_tracks()
-            my_codes = list(tracks.get(owner, []))
-            if not my_codes:
-                reply("清單是空的。先用：add 台積電 或 add 2330")
-                return
-
-            y = _taipei_today() - timedelta(days=1)
-            s = _roc_date(y)
-            all_rows = []
-
-            for code in my_codes:
-                name = get_stock_name_by_code(code) or code
-                rows = get_historical_announcements(s, s, subject=name)
-                all_rows.extend(rows)
-
-            msg, truncated = _fmt_rows(all_rows, max_chars=4800)
-            if truncated:
-                msg += "\n\n📎 顯示不完，請至公開資訊觀測站查閱：\n🔗 https://mops.twse.com.tw"
-
-            reply("🗓 昨日公告：\n\n" + msg)
+        match = _match_command(t.lower())
+        if match is None:
+            reply(HELP_TEXT)
             return
+        n, func = match
+        func(owner, t[n:].strip(), reply)
 
+    except Exception as e:
+        reply(f"發生錯誤：{e}")
 
-        # === 原本的指令 ===
-        if t.startswith("mops today"):
-            kw = t.replace("mops today", "", 1).strip()
-            rows = get_today_major_announcements(kw)
-            msg, truncated = _fmt_rows(rows, max_chars=4800)
-            if not msg.strip():
-                msg = "今日查無資料"
-            elif truncated:
-                msg += "\n\n📎 更多公告請參考公開資訊觀測站：\n🔗 https://mops.twse.com.tw"
-            reply(msg)
-            return
-        
-        if t.startswith("mops range"):
-            parts = t.split()
-            if len(parts) >= 4:
-                sdate, edate = parts[2], parts[3]
-                subject = " ".join(parts[4:]) if len(parts) > 4 else ""
-
-                if not subject:
-                    reply("請提供查詢關鍵字，例如公司名稱或主旨內容\n用法：mops range 114/08/01 114/08/31 台積電")
-                    return
-
-                # 限制區間
-                try:
-                    start = _parse_roc_date(sdate)
-                    end = _parse_roc_date(edate)
-                    if (end - start).days > 90:
-                        reply("查詢區間最多支援 90 天，請縮短日期範圍")
-                        return
-                except:
-                    reply("日期格式錯誤，請用 114/08/01 格式")
-                    return
-
-                rows = get_historical_announcements(sdate, edate, subject=subject)
-                msg, truncated = _fmt_rows(rows, max_chars=4800)
-                if truncated:
-                    msg += "\n\n📎 顯示不完，請至公開資訊觀測站查閱：\n🔗 https://mops.twse.com.tw"
-                reply(msg or "無資料")
-            else:
-                reply("用法：mops range 114/08/01 114/08/31 [關鍵字]")
-            return
-
-        if t.startswith("book"):
-            rows = get_bookbuilding_announcements()
-            msg, truncated = _fmt_bookbuild_rows(rows)
-            if not msg.strip():
-                msg = "查無詢圈公告"
-            elif truncated:
-                msg += "\n\n📎 更多請參考公開資訊觀測站：\n🔗 https://mops.twse.com.tw"
-            reply(f"📦 詢圈資訊：\n\n{msg}")
-            return
-
-        if t.startswith("stock name"):
-            code = t.replace("stock name", "", 1).strip()
-            reply(get_stock_name_by_code(code) or "查無此代號")
-            return
-
-        if t.startswith("stock code"):
-            name = t.replace("stock code", "", 1).strip()
-            reply(get_stock_code_by_name(name) or "查無此名稱")
-            return
-
-        # === Help ===
-        reply(
-            "可用指令：\n"
-            "1) add <股票代號或名稱>\n"
-            "2) del <股票代號或名稱>\n"
-            "3) ls\n"
-            "4) clear\n"
-            "5) 爬取今日數據\n"
-            "6) 爬取昨日數據\n"
-            "其他：\n"
-            "• mops today [關鍵字]\n"
-            "• mops range 114/08/01 114/08/31 [關鍵字]\n"
-            "• book\n"
-            "• stock name 2330 / stock code 台積電"
-        )
 
+# ====== 冷啟動預熱 ======
+# 先把追蹤清單載進快取，第一個 webhook 進來時就不用等 Google Sheet；
+# /tmp 快照還沒過期的話連 Google Sheet 都不用讀。
+# 讀表放到背景執行緒，不拖慢 gunicorn worker 開機
+def _warm_up():
+    try:
+        get_sheet()  # 先建好憑證與 sheet 連線，第一個請求不用再等授權
+    except Exception as e:  # 本機開發沒有金鑰檔時只印出來，之後的請求會再試
+        print(f"[Google Sheet 初始化失敗] {e}")
+        return
+    try:
+        load_tracks()
     except Exception as e:
-        reply(f"發生錯誤：{e}")
+        print(f"[追蹤清單預熱失敗] {e}")
+
+_read_snapshot()
+threading.Thread(target=_warm_up, daemon=True).start()
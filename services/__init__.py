@@ -7,25 +7,35 @@
 
 from .mops_service import (
     get_today_major_announcements,
+    get_today_major_announcements_bulk,
     get_historical_announcements,
 )
 from .bookbuilding_service import get_bookbuilding_announcements
 from .tw_stock_service import (
     get_stocks_list,
     get_stock_name_by_code,
+    resolve_names_bulk,
     get_stock_code_by_name,
+    suggest_stocks,
+    resolve_stock_by_name,
+    resolve_stock,
     refresh_stocks
 )
 
 __all__ = [
     # MOPS
     "get_today_major_announcements",
+    "get_today_major_announcements_bulk",
     "get_historical_announcements",
     # Bookbuilding
     "get_bookbuilding_announcements",
     # Stocks
     "get_stocks_list",
     "get_stock_name_by_code",
+    "resolve_names_bulk",
     "get_stock_code_by_name",
+    "suggest_stocks",
+    "resolve_stock_by_name",
+    "resolve_stock",
     "refresh_stocks",     
 ]
@@ -2,9 +2,49 @@
 封裝對外服務介面，整合今日重大訊息與歷史重大訊息（ezsearch_query）。
 """
 
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import ahocorasick
+
 from tw_scrapers.mops_today_news import fetch_today_major_announcements
 from tw_scrapers.mops_historical_news import fetch_ezsearch
 
+# 今日重大訊息整份（不過濾）的短期快取：同一段時間內所有使用者、所有關鍵字共用一次抓取，
+# 各自的關鍵字在記憶體裡過濾
+TODAY_FEED_TTL_SECONDS = 60
+# ezsearch 一次最多回 1000 筆，單日查詢沒辦法再切；不帶關鍵字的結果滿了就改成每個關鍵字各查一次
+EZSEARCH_ROW_CAP = 1000
+# 逐關鍵字查詢用的池子；不能跟 fetch_ezsearch 內部切日期區段的池子共用，否則外層佔滿工作緒會互相等死
+_SUBJECT_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ezsearch-subject")
+_TODAY_FEED: tuple[float, list[dict]] | None = None
+_TODAY_FEED_LOCK = threading.Lock()
+
+
+def _get_today_feed() -> list[dict]:
+    """回傳今日全部重大訊息；快取過期時只讓一個執行緒去抓，其他人等結果。"""
+    global _TODAY_FEED
+    with _TODAY_FEED_LOCK:
+        if _TODAY_FEED is None or time.monotonic() - _TODAY_FEED[0] >= TODAY_FEED_TTL_SECONDS:
+            _TODAY_FEED = (time.monotonic(), fetch_today_major_announcements())
+        return _TODAY_FEED[1]
+
+
+def _match(row: dict, keyword: str) -> bool:
+    return keyword in row["subject"] or keyword in row["name"]
+
+
+@lru_cache(maxsize=64)
+def _keyword_automaton(keywords: frozenset[str]) -> ahocorasick.Automaton:
+    """多個關鍵字建成一台 Aho-Corasick 自動機；同一組關鍵字只建一次。"""
+    automaton = ahocorasick.Automaton()
+    for kw in keywords:
+        automaton.add_word(kw, kw)
+    automaton.make_automaton()
+    return automaton
+
 
 def get_today_major_announcements(keyword: str = "") -> list[dict]:
     """取得「今日」重大訊息（僅當日有資料；歷史請改用 ezsearch）。
@@ -14,8 +54,37 @@ def get_today_major_announcements(keyword: str = "") -> list[dict]:
 
     Returns:
         list[dict]: 每筆含 {co_id, name, date_pub, date_say, subject}
+
+    整份資料最多快取 TODAY_FEED_TTL_SECONDS 秒，與 get_today_major_announcements_bulk 共用。
     """
-    return fetch_today_major_announcements(keyword)
+    rows = _get_today_feed()
+    return [r for r in rows if _match(r, keyword)] if keyword else list(rows)
+
+
+def get_today_major_announcements_bulk(keywords: list[str]) -> dict[str, list[dict]]:
+    """一次取得多個關鍵字的「今日」重大訊息，整批只打一次 API。
+
+    Args:
+        keywords (list[str]): 關鍵字清單，比對規則同 get_today_major_announcements。
+
+    Returns:
+        dict[str, list[dict]]: 關鍵字 → 該關鍵字的公告（欄位同 get_today_major_announcements）
+    """
+    rows = _get_today_feed()
+    result: dict[str, list[dict]] = {kw: [] for kw in keywords}
+    words = frozenset(kw for kw in result if kw)
+    if "" in result:
+        result[""] = list(rows)  # 空字串 = 不過濾
+    if not words:
+        return result
+
+    # 每筆公告只掃一次（主旨 + 公司名稱），一次找出所有命中的關鍵字，不用每個關鍵字各掃一遍
+    automaton = _keyword_automaton(words)
+    for r in rows:
+        haystack = f"{r['subject']}\0{r['name']}"  # \0 隔開，避免關鍵字跨兩個欄位命中
+        for kw in {kw for _, kw in automaton.iter(haystack)}:
+            result[kw].append(r)
+    return result
 
 
 def get_historical_announcements(
@@ -27,6 +96,7 @@ def get_historical_announcements(
     pro_item: str = "",
     *,
     mode: str = "full",
+    subjects: list[str] | None = None,
 ) -> list[dict]:
     """
     取得歷史重大訊息，回傳統一欄位格式：
@@ -40,37 +110,52 @@ def get_historical_announcements(
     - co_id (str): 公司代號（可選）
     - pro_item (str): 公告項目類別（可選）
     - mode (str): 模式選項，預設 "full"
+    - subjects (list[str]): 多個主旨關鍵字（可選）；給了就忽略 subject，
+      先查一次不帶關鍵字的結果，再依序挑出主旨含各關鍵字的公告；
+      不帶關鍵字的結果達 EZSEARCH_ROW_CAP 筆（可能被截斷）時，改成每個關鍵字並行各查一次
 
     回傳：
     - list[dict]：包含標準化欄位的歷史公告資料
     """
-    raw_rows = fetch_ezsearch(
-        sdate=sdate,
-        edate=edate,
-        subject=subject,
-        typek=typek,
-        co_id=co_id,
-        pro_item=pro_item,
-        mode=mode,
-    )
-
-    normalized = []
-    for r in raw_rows:
-        normalized.append({
+    def query(subj: str) -> list[dict]:
+        return _normalize_rows(fetch_ezsearch(
+            sdate=sdate,
+            edate=edate,
+            subject=subj,
+            typek=typek,
+            co_id=co_id,
+            pro_item=pro_item,
+            mode=mode,
+        ))
+
+    if subjects is None:
+        return query(subject)
+
+    normalized = query("")
+    if len(normalized) >= EZSEARCH_ROW_CAP:
+        futures = [_SUBJECT_POOL.submit(query, subj) for subj in subjects]
+        return [r for fut in futures for r in fut.result()]
+    # 主旨字串先取好一次，每個關鍵字只剩一次子字串比對
+    haystack = [(r["subject"] or "", r) for r in normalized]
+    return [r for subj in subjects for text, r in haystack if subj in text]
+
+
+def _normalize_rows(raw_rows: list[dict]) -> list[dict]:
+    return [
+        {
             "co_id": r.get("代號"),
             "name": r.get("簡稱"),
             "date_pub": r.get("日期"),
             "date_say": r.get("時間"),
             "subject": r.get("主旨"),
             "url": r.get("連結"),
-        })
-    return normalized
+        }
+        for r in raw_rows
+    ]
 
 
 
 if __name__ == "__main__":
-    import time
-
     # 快速模式（最多約 1000 筆）
     t0 = time.time()
     fast_rows = get_historical_announcements("111/05/30", "112/08/30", subject="股息", mode="fast")
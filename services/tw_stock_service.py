@@ -1,8 +1,247 @@
 """tw_stock_service.py
 封裝對外服務介面，提供股票代號與名稱的查詢功能。"""
 
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
 from tw_scrapers.twstocks import TwStock
 
+# 逐檔查詢名稱時的並行上限，避免對 TWSE 送出太多同時連線
+_LOOKUP_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="stock-lookup")
+
+# 全模組共用一份股票清單，超過 STOCK_TTL_SECONDS 才重新抓取；
+# 抓取失敗（清單是空的）時不更新 _STOCK_UTIL_AT，等 STOCK_RETRY_SECONDS 後再試，
+# 連續失敗就加倍（最多 STOCK_RETRY_MAX_SECONDS），不要每個指令都去重抓四個來源
+STOCK_TTL_SECONDS = 12 * 3600
+STOCK_RETRY_SECONDS = 60
+STOCK_RETRY_MAX_SECONDS = 30 * 60
+_STOCK_UTIL: TwStock | None = None
+_STOCK_UTIL_AT: float | None = None  # 上次成功載入的時間（time.monotonic()）
+_STOCK_UTIL_FAILED_AT: float | None = None  # 上次抓取失敗的時間
+_STOCK_UTIL_FAILURES = 0  # 連續失敗次數
+_STOCK_UTIL_LOCK = threading.Lock()
+
+
+class _Miss(Exception):
+    """_cache_hits 內部用：帶著查不到的結果跳出 lru_cache，讓它不被快取。"""
+
+
+def _cache_hits(maxsize: int, miss=None):
+    """Like lru_cache, but results equal to ``miss`` are not cached.
+
+    查不到多半是即時報價 API 逾時或股票清單還沒抓到，快取起來會一直查不到直到下次 refresh_stocks；
+    所以只快取查到的結果，查不到的下次再查。cache_clear() 用法同 lru_cache。
+    """
+    def decorator(func):
+        @lru_cache(maxsize=maxsize)
+        def cached(*args, **kwargs):
+            result = func(*args, **kwargs)
+            if result == miss:
+                raise _Miss(result)  # lru_cache 不快取例外
+            return result
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return cached(*args, **kwargs)
+            except _Miss as e:
+                return e.args[0]
+
+        wrapper.cache_clear = cached.cache_clear
+        wrapper.cache_info = cached.cache_info
+        return wrapper
+    return decorator
+
+
+def _refresh_due() -> bool:
+    """清單過期，而且離上次失敗已經超過重試間隔時才需要重抓。"""
+    now = time.monotonic()
+    if _STOCK_UTIL_AT is not None and now - _STOCK_UTIL_AT < STOCK_TTL_SECONDS:
+        return False
+    if _STOCK_UTIL_FAILED_AT is not None:
+        delay = min(STOCK_RETRY_SECONDS * 2 ** (_STOCK_UTIL_FAILURES - 1), STOCK_RETRY_MAX_SECONDS)
+        if now - _STOCK_UTIL_FAILED_AT < delay:
+            return False
+    return True
+
+
+def _get_stock_util() -> TwStock:
+    """回傳共用的 TwStock；第一次呼叫時建立，過期時重新整理並清掉衍生的索引與快取。
+
+    已經有清單時，別的執行緒正在重抓就直接回傳現有的清單，不排在鎖後面等。
+    """
+    global _STOCK_UTIL
+    if _STOCK_UTIL is not None and not _refresh_due():
+        return _STOCK_UTIL
+    if _STOCK_UTIL is not None:
+        if not _STOCK_UTIL_LOCK.acquire(blocking=False):
+            return _STOCK_UTIL
+    else:
+        _STOCK_UTIL_LOCK.acquire()
+    try:
+        if _STOCK_UTIL is None:
+            stock_util = TwStock()
+            _mark_loaded(bool(stock_util.all_items))
+            _STOCK_UTIL = stock_util
+        elif _refresh_due():
+            _refresh_locked()
+    finally:
+        _STOCK_UTIL_LOCK.release()
+    return _STOCK_UTIL
+
+
+def _mark_loaded(ok: bool) -> None:
+    """記錄這次抓取成功或失敗的時間；呼叫端要持有 _STOCK_UTIL_LOCK。"""
+    global _STOCK_UTIL_AT, _STOCK_UTIL_FAILED_AT, _STOCK_UTIL_FAILURES
+    if ok:
+        _STOCK_UTIL_AT = time.monotonic()
+        _STOCK_UTIL_FAILED_AT, _STOCK_UTIL_FAILURES = None, 0
+    else:
+        _STOCK_UTIL_FAILED_AT = time.monotonic()
+        _STOCK_UTIL_FAILURES += 1
+
+
+def _refresh_locked() -> bool:
+    """重抓股票清單，成功時清掉所有衍生資料；呼叫端要持有 _STOCK_UTIL_LOCK。
+    抓不到資料時沿用舊清單與快取，回傳 False。"""
+    global _NAME_INDEX, _STOCKS_BY_KEY
+    ok = _STOCK_UTIL.refresh(force=True)
+    _mark_loaded(ok)
+    if not ok:
+        return False
+    _NAME_INDEX = _STOCKS_BY_KEY = None
+    get_stock_name_by_code.cache_clear()
+    get_stock_code_by_name.cache_clear()
+    resolve_stock_by_name.cache_clear()
+    return True
+
+
+class _TrieNode:
+    __slots__ = ("edges", "value")
+
+    def __init__(self, value: str | None = None):
+        self.edges: dict[str, tuple[str, "_TrieNode"]] = {}  # 邊標籤首字 → (邊標籤, 子節點)
+        self.value = value
+
+
+class StockNameTrie:
+    """Radix (PATRICIA) trie mapping stock names to codes.
+
+    每條邊存一整段字串，只有分岔處才有節點，共用前綴只存一次。
+    查詢成本只跟輸入長度有關，與股票數量無關。
+    """
+
+    def __init__(self, items: list[tuple[str, str]] = ()):
+        self._root = _TrieNode()
+        for key, value in items:
+            self.insert(key, value)
+
+    def insert(self, key: str, value: str) -> None:
+        """加入 key → value；同一個 key 已存在時保留先加入的值。"""
+        node = self._root
+        while key:
+            edge = node.edges.get(key[0])
+            if edge is None:
+                node.edges[key[0]] = (key, _TrieNode(value))
+                return
+            label, child = edge
+            n = 0
+            while n < len(label) and n < len(key) and label[n] == key[n]:
+                n += 1
+            if n < len(label):  # 從分岔處把邊切成兩段
+                mid = _TrieNode()
+                mid.edges[label[n]] = (label[n:], child)
+                node.edges[key[0]] = (label[:n], mid)
+                child = mid
+            node, key = child, key[n:]
+        if node.value is None:
+            node.value = value
+
+    def lookup(self, key: str) -> str | None:
+        """精確比對，回傳對應的值或 None。"""
+        node = self._root
+        while key:
+            edge = node.edges.get(key[0])
+            if edge is None or not key.startswith(edge[0]):
+                return None
+            node, key = edge[1], key[len(edge[0]):]
+        return node.value
+
+    def prefix_lookup(self, prefix: str, limit: int | None = None) -> list[tuple[str, str]]:
+        """回傳所有以 prefix 開頭的 (key, value)，最多 limit 筆。"""
+        node, path, rest = self._root, "", prefix
+        while rest:
+            edge = node.edges.get(rest[0])
+            if edge is None:
+                return []
+            label, child = edge
+            if rest.startswith(label):
+                rest = rest[len(label):]
+            elif label.startswith(rest):
+                rest = ""
+            else:
+                return []
+            node, path = child, path + label
+
+        out: list[tuple[str, str]] = []
+        stack = [(path, node)]
+        while stack and (limit is None or len(out) < limit):
+            key, cur = stack.pop()
+            if cur.value is not None:
+                out.append((key, cur.value))
+            stack.extend((key + label, child) for label, child in reversed(cur.edges.values()))
+        return out
+
+
+_NAME_INDEX: tuple[StockNameTrie, TwStock] | None = None
+
+
+def _get_name_index() -> tuple[StockNameTrie, TwStock]:
+    """回傳 (名稱 trie, 建 trie 用的那份股票清單)，第一次呼叫時才建立。
+
+    每次都先經過 _get_stock_util()：清單過期重抓成功時會清掉舊索引，這裡再重建。
+    清單是空的（來源都抓不到）時建出來的空索引不快取，等抓到資料後再建。
+    """
+    global _NAME_INDEX
+    stock_util = _get_stock_util()
+    index = _NAME_INDEX
+    if index is None:
+        items = stock_util.all_items
+        # 先放簡稱再放全名，名稱重覆時以簡稱為準
+        trie = StockNameTrie(
+            [(it["short"], it["code"]) for it in items if it.get("short")]
+            + [(it["name"], it["code"]) for it in items]
+        )
+        index = (trie, stock_util)
+        if items and stock_util.all_items is items:  # 建的途中清單被換掉就不要存舊的
+            _NAME_INDEX = index
+    return index
+
+
+_STOCKS_BY_KEY: dict[str, tuple[str, str]] | None = None
+
+
+def _get_key_index() -> dict[str, tuple[str, str]]:
+    """回傳 代號／簡稱／全名 → (股票代號, 顯示名稱) 的對照表，第一次呼叫時才建立。
+    跟 _get_name_index 一樣，清單過期會重建、空清單不快取。"""
+    global _STOCKS_BY_KEY
+    _, stock_util = _get_name_index()
+    keys = _STOCKS_BY_KEY
+    if keys is None:
+        items = stock_util.all_items
+        display = {it["code"]: stock_util.get_name(it["code"]) for it in items}
+        keys = {}
+        # 代號優先，其次簡稱、全名；同一個 key 保留先放入的
+        for field in ("code", "short", "name"):
+            for it in items:
+                key = it.get(field)
+                if key and key not in keys:
+                    keys[key] = (it["code"], display[it["code"]])
+        if items and stock_util.all_items is items:
+            _STOCKS_BY_KEY = keys
+    return keys
+
 def get_stocks_list() -> list[dict]:
     """Return the full list of all stocks (上市+上櫃).
 
@@ -14,10 +253,11 @@ def get_stocks_list() -> list[dict]:
     Returns:
         list[dict]: Stock list with code, name, short.
     """
-    stock_util = TwStock()
+    stock_util = _get_stock_util()
     return stock_util.all_items
 
 
+@_cache_hits(maxsize=8192)
 def get_stock_name_by_code(code: str, clean: bool = True) -> str | None:
     """Get the company name by stock code.
 
@@ -27,11 +267,43 @@ def get_stock_name_by_code(code: str, clean: bool = True) -> str | None:
 
     Returns:
         str | None: 公司名稱或簡稱，若找不到則回傳 None.
+
+    查到的結果會快取到下次 refresh_stocks；找不到（含即時報價 API 失敗）不快取，下次再查。
     """
-    stock_util = TwStock()
+    stock_util = _get_stock_util()
     return stock_util.get_name(code, clean)
 
 
+def resolve_names_bulk(codes: list[str], clean: bool = True) -> dict[str, str | None]:
+    """Resolve many stock codes to names with a single stock table.
+
+    與逐一呼叫 get_stock_name_by_code 相同，但整批只建立一次股票清單。
+
+    Args:
+        codes (list[str]): 股票代號清單.
+        clean (bool, optional): 是否去掉尾綴『股份有限公司／有限公司』. Defaults to True.
+
+    Returns:
+        dict[str, str | None]: 代號 → 公司名稱或簡稱，找不到的為 None.
+    """
+    stock_util = _get_stock_util()
+    names: dict[str, str | None] = {}
+    missing = []
+    for code in dict.fromkeys(codes):
+        if code in stock_util.code2item:
+            names[code] = stock_util.get_name(code, clean)
+        else:
+            missing.append(code)
+
+    # 不在公司清單裡的（例如 ETF）要逐檔打即時報價 API，改成並行送出；
+    # 走 get_stock_name_by_code 才會用到（並填入）它的快取，同一檔不會每次都重打 API
+    futures = [(code, _LOOKUP_POOL.submit(get_stock_name_by_code, code, clean)) for code in missing]
+    for code, fut in futures:
+        names[code] = fut.result()
+    return names
+
+
+@lru_cache(maxsize=8192)
 def get_stock_code_by_name(name: str) -> str | list[dict] | None:
     """Get the stock code by company name (簡稱優先 → 全名 → 模糊比對).
 
@@ -50,13 +322,15 @@ def get_stock_code_by_name(name: str) -> str | list[dict] | None:
             - str: 單一股票代號
             - list[dict]: 多筆候選，包含 code/name/short
             - None: 找不到
+
+    結果會快取到下次 refresh_stocks。
     """
-    stock_util = TwStock()
+    stock_util = _get_stock_util()
 
     # 1) 精確比對簡稱
-    for it in stock_util.all_items:
-        if it.get("short") == name:
-            return it["code"]
+    code = stock_util.short2code.get(name)
+    if code:
+        return code
 
     # 2) 精確比對全名
     code = stock_util.get_code(name)
@@ -73,20 +347,83 @@ def get_stock_code_by_name(name: str) -> str | list[dict] | None:
     # 多筆候選 → 回傳前 10 筆，提醒使用者不唯一
     return matches
 
+def suggest_stocks(prefix: str, limit: int = 10) -> list[tuple[str, str]]:
+    """List stocks whose short or full name starts with the given prefix.
+
+    Args:
+        prefix (str): 名稱開頭.
+        limit (int, optional): 最多回傳筆數. Defaults to 10.
+
+    Returns:
+        list[tuple[str, str]]: (名稱, 股票代號) 清單.
+    """
+    return _get_name_index()[0].prefix_lookup(prefix, limit)
+
+
+@_cache_hits(maxsize=4096, miss=(None, None))
+def resolve_stock_by_name(name: str) -> tuple[str | None, str | None]:
+    """Resolve a company name to (code, display name) in one pass.
+
+    先精確比對簡稱／全名；對不到時，名稱開頭只對到一檔就採用；
+    開頭也對不到時，名稱或簡稱包含關鍵字的只有一檔就採用（例如「積電」）。
+    代號與名稱取自同一份股票清單，不用再另外查一次名稱。
+
+    Args:
+        name (str): 公司簡稱、全名、名稱開頭或名稱中的片段.
+
+    Returns:
+        tuple[str | None, str | None]: (股票代號, 公司名稱或簡稱)，找不到則為 (None, None).
+
+    查到的結果會快取到下次 refresh_stocks；找不到不快取，下次再查。
+    """
+    trie, stock_util = _get_name_index()
+    code = trie.lookup(name)
+    if not code:
+        candidates = {c for _, c in trie.prefix_lookup(name, 10)}
+        if not candidates:
+            candidates = {it["code"] for it in stock_util.search_by_name(name, clean=False)}
+        if len(candidates) != 1:
+            return None, None
+        code = candidates.pop()
+    return code, stock_util.get_name(code) or name
+
+
+def resolve_stock(token: str) -> tuple[str | None, str | None]:
+    """Resolve a stock code or name to (code, display name).
+
+    代號、簡稱、全名都先查同一張對照表，一次 dict 查詢就好；
+    查不到時，數字走 get_stock_name_by_code（清單外的 ETF 等），其餘走 resolve_stock_by_name 的開頭比對。
+
+    Args:
+        token (str): 股票代號、公司簡稱、全名或名稱開頭.
+
+    Returns:
+        tuple[str | None, str | None]: (股票代號, 公司名稱或簡稱)，找不到則為 (None, None).
+    """
+    hit = _get_key_index().get(token)
+    if hit:
+        return hit
+    if token.isdigit():
+        name = get_stock_name_by_code(token)
+        return (token, name) if name else (None, None)
+    return resolve_stock_by_name(token)
+
+
 def refresh_stocks() -> list[dict]:
     """強制刷新股票清單，忽略快取 TTL。
 
     Returns:
         list[dict]: 最新股票清單
     """
-    stock_util = TwStock()
-    stock_util.refresh(force=True)
+    stock_util = _get_stock_util()
+    with _STOCK_UTIL_LOCK:
+        _refresh_locked()
     return stock_util.all_items
 
 
 
 if __name__ == "__main__":
-    print("Stocks", len(TwStock().all_items))
+    print("Stocks", len(_get_stock_util().all_items))
     print("Sample stocks:", get_stocks_list()[:5])
     print("Stock name for code '2330':", get_stock_name_by_code("2330"))
     print("Stock code for name '台積電':", get_stock_code_by_name("台積電"))
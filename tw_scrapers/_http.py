@@ -0,0 +1,16 @@
+"""tw_scrapers 共用的 HTTP 連線。
+
+所有爬蟲都走同一個 requests.Session，對同一台主機的 TCP/TLS 連線可以重複使用，
+不必每個請求重新握手；暫時性的錯誤由 adapter 自動重試。
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+SESSION = requests.Session()
+# 閘道暫時性錯誤（502/503/504）與連線失敗自動退避重試；預設只重試 GET 等冪等請求
+_RETRY = Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504))
+_ADAPTER = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=_RETRY)
+SESSION.mount("https://", _ADAPTER)
+SESSION.mount("http://", _ADAPTER)
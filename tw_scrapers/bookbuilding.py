@@ -1,32 +1,40 @@
 """抓取臺灣證券商業同業公會之「詢圈公告」資料。"""
 from __future__ import annotations
-from bs4 import BeautifulSoup
+import io
 from typing import List, Dict, Optional
-import requests
+from lxml import etree, html
+
+from ._http import SESSION
 
 URL = "https://web.twsa.org.tw/edoc2/default.aspx"
+RESULT_TABLE_ID = "ctl00_cphMain_gvResult"
 HEADERS = {
     "User-Agent": "mops-bot/1.0",
     "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
     "Accept-Language": "zh-TW,zh;q=0.9,en;q=0.8",
 }
 
-def _val(soup: BeautifulSoup, name: str) -> Optional[str]:
-    tag = soup.find("input", {"name": name})
-    return tag.get("value") if tag else None
+def _val(tree: html.HtmlElement, name: str) -> Optional[str]:
+    values = tree.xpath("//input[@name=$name]/@value", name=name)
+    return values[0] if values else None
+
+def _cell_text(td: etree._Element) -> str:
+    # 同 BeautifulSoup 的 get_text(strip=True)：每段文字各自去空白後串起來
+    return "".join(t.strip() for t in td.itertext())
 
 def fetch_bookbuilding(year: str = "114") -> List[Dict]:
     try:
-        resp1 = requests.get(URL, headers=HEADERS, verify=False)
+        resp1 = SESSION.get(URL, headers=HEADERS, verify=False)
         resp1.raise_for_status()
     except Exception as e:
         raise RuntimeError(f"GET warmup failed: {e}")
 
-    soup1 = BeautifulSoup(resp1.text, "html.parser")
+    # 給 bytes 時 lxml 只看 <meta> 猜編碼，不會理 HTTP 標頭的 charset，所以明確帶進去
+    tree1 = html.fromstring(resp1.content, parser=html.HTMLParser(encoding=resp1.encoding))
 
-    vs  = _val(soup1, "__VIEWSTATE")
-    vsg = _val(soup1, "__VIEWSTATEGENERATOR")
-    ev  = _val(soup1, "__EVENTVALIDATION")
+    vs  = _val(tree1, "__VIEWSTATE")
+    vsg = _val(tree1, "__VIEWSTATEGENERATOR")
+    ev  = _val(tree1, "__EVENTVALIDATION")
     if not (vs and vsg and ev):
         return []
 
@@ -42,7 +50,7 @@ def fetch_bookbuilding(year: str = "114") -> List[Dict]:
     }
 
     try:
-        resp2 = requests.post(
+        resp2 = SESSION.post(
             URL,
             data=form,
             headers={**HEADERS, "Content-Type": "application/x-www-form-urlencoded"},
@@ -52,15 +60,23 @@ def fetch_bookbuilding(year: str = "114") -> List[Dict]:
     except Exception as e:
         raise RuntimeError(f"POST query failed: {e}")
 
-    soup2 = BeautifulSoup(resp2.text, "html.parser")
-    table = soup2.find("table", {"id": "ctl00_cphMain_gvResult"})
-    if not table:
-        return []
-
+    # 結果頁用 iterparse 逐列處理：每個 <tr> 讀完就取值並清掉，不必先建好整棵 DOM 樹
     rows: List[Dict] = []
-    trs = table.find_all("tr")
-    for tr in trs[1:]:
-        tds = [td.get_text(strip=True) for td in tr.find_all("td")]
+    seen_header = False
+    for _, tr in etree.iterparse(
+        io.BytesIO(resp2.content), events=("end",), tag="tr", html=True, encoding=resp2.encoding
+    ):
+        table = next(tr.iterancestors("table"), None)
+        in_result = table is not None and table.get("id") == RESULT_TABLE_ID
+        tds = [_cell_text(td) for td in tr.iter("td")] if in_result else []
+        tr.clear()
+        while tr.getprevious() is not None:  # 前面處理過的列也一併釋放
+            del tr.getparent()[0]
+        if not in_result:
+            continue
+        if not seen_header:  # 第一列是表頭
+            seen_header = True
+            continue
         if len(tds) < 8:
             continue
         rows.append({
@@ -1,11 +1,15 @@
 """抓取「公開資訊觀測站」歷史重大訊息（ezsearch_query API）"""
 from __future__ import annotations
-import json
+import threading
+import orjson
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 from typing import List, Dict
-import requests
+
+from ._http import SESSION
 
 URL = "https://mopsov.twse.com.tw/mops/web/ezsearch_query"
+WARMUP_URL = "https://mopsov.twse.com.tw/mops/web/ezsearch"
 HEADERS = {
     "User-Agent": "Mozilla/5.0",
     "Origin": "https://mopsov.twse.com.tw",
@@ -15,6 +19,26 @@ HEADERS = {
     "X-Requested-With": "XMLHttpRequest",
 }
 
+# full 模式各區段同時查詢的上限；整個程序共用，多人同時查也不會對 MOPS 開太多連線
+_CHUNK_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ezsearch")
+
+_WARM_LOCK = threading.Lock()
+_warmed = False
+
+def _warm_up():
+    """先開一次查詢頁（可有可無，拿到 cookie 較穩）；共用 Session，整個程序只需做一次。"""
+    global _warmed
+    if _warmed:
+        return
+    with _WARM_LOCK:
+        if _warmed:
+            return
+        try:
+            SESSION.get(WARMUP_URL, timeout=10, verify=False)
+            _warmed = True
+        except Exception as e:
+            print(f"[ezsearch 暖機失敗] {e}")
+
 def _roc_to_date(roc: str) -> datetime:
     y, m, d = roc.split("/")
     return datetime(int(y) + 1911, int(m), int(d))
@@ -30,6 +54,7 @@ def _normalize_typek(t: str) -> str:
     return ""
 
 def _post_once(sdate: str, edate: str, *, subject: str, typek: str, co_id: str, pro_item: str) -> List[Dict]:
+    global _warmed
     form = {
         "step": "00",
         "RADIO_CM": "1",
@@ -44,38 +69,46 @@ def _post_once(sdate: str, edate: str, *, subject: str, typek: str, co_id: str,
         "AN": "",
     }
 
-    # 暖機（可有可無）
-    requests.get("https://mopsov.twse.com.tw/mops/web/ezsearch", verify=False)
+    _warm_up()
 
     try:
-        resp = requests.post(URL, data=form, headers=HEADERS, verify=False)
+        resp = SESSION.post(URL, data=form, headers=HEADERS, verify=False)
         resp.raise_for_status()
-        text = resp.text
     except Exception as e:
+        _warmed = False  # cookie 可能過期了，下次查詢前重新暖機
         raise RuntimeError(f"ezsearch_query HTTP error: {e}")
 
-    cleaned = text.lstrip("\ufeff \n\r\t")
-    i = cleaned.find("{")
-    if i < 0: return []
-    payload = json.loads(cleaned[i:])
+    # 直接解析原始 bytes；前面多了 BOM 等雜訊解析失敗時，才從第一個 { 開始切
+    body = resp.content
+    try:
+        payload = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        i = body.find(b"{")
+        if i < 0: return []
+        payload = orjson.loads(body[i:])
+    if not isinstance(payload, dict): return []
     return payload.get("data", []) or []
 
 
+# 輸出欄位 ← API 欄位；「代號」在 CO_ID 沒值時再依序改用 STOCK_ID、COMPANY_ID
+_FIELD_MAP = (
+    ("日期", "CDATE"),
+    ("時間", "CTIME"),
+    ("市場", "TYPEK"),
+    ("產業", "CODE_NAME"),
+    ("代號", "CO_ID"),
+    ("簡稱", "COMPANY_NAME"),
+    ("項目代碼", "AN_CODE"),
+    ("項目", "AN_NAME"),
+    ("主旨", "SUBJECT"),
+    ("連結", "HYPERLINK"),
+)
+
 def _normalize(data: List[Dict]) -> List[Dict]:
-    rows = []
-    for row in data:
-        rows.append({
-            "日期": row.get("CDATE"),
-            "時間": row.get("CTIME"),
-            "市場": row.get("TYPEK"),
-            "產業": row.get("CODE_NAME"),
-            "代號": row.get("CO_ID") or row.get("STOCK_ID") or row.get("COMPANY_ID"),
-            "簡稱": row.get("COMPANY_NAME"),
-            "項目代碼": row.get("AN_CODE"),
-            "項目": row.get("AN_NAME"),
-            "主旨": row.get("SUBJECT"),
-            "連結": row.get("HYPERLINK"),
-        })
+    rows = [{out: row.get(src) for out, src in _FIELD_MAP} for row in data]
+    for out, row in zip(rows, data):
+        if not out["代號"]:
+            out["代號"] = row.get("STOCK_ID") or row.get("COMPANY_ID")
     return rows
 
 def fetch_ezsearch(
@@ -98,26 +131,42 @@ def fetch_ezsearch(
                           subject=subject, typek=typek, co_id=co_id, pro_item=pro_item)
         rows = _normalize(data)
     else:
-        def _fetch_chunk(a: datetime, b: datetime) -> List[Dict]:
-            raw = _post_once(_date_to_roc(a), _date_to_roc(b),
-                             subject=subject, typek=typek, co_id=co_id, pro_item=pro_item)
-            if len(raw) >= 1000 and (b - a).days >= 1:
-                mid = a + (b - a) // 2
-                return _fetch_chunk(a, mid) + _fetch_chunk(mid + timedelta(days=1), b)
-            return _normalize(raw)
-
-        rows_all: List[Dict] = []
+        def _submit(a: datetime, b: datetime):
+            fut = _CHUNK_POOL.submit(_post_once, _date_to_roc(a), _date_to_roc(b),
+                                     subject=subject, typek=typek, co_id=co_id, pro_item=pro_item)
+            pending[fut] = (a, b)
+
+        # 先切成 30 天一段全部送出；某段滿 1000 筆（可能被截斷）就對半切再送回池子
+        pending: Dict = {}
+        done_chunks: Dict[datetime, List[Dict]] = {}
         cur = start_dt
         while cur <= end_dt:
             to = min(cur + timedelta(days=30), end_dt)
-            rows_all.extend(_fetch_chunk(cur, to))
+            _submit(cur, to)
             cur = to + timedelta(days=1)
 
-        seen, rows = set(), []
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                a, b = pending.pop(fut)
+                raw = fut.result()
+                if len(raw) >= 1000 and (b - a).days >= 1:
+                    mid = a + (b - a) // 2
+                    _submit(a, mid)
+                    _submit(mid + timedelta(days=1), b)
+                else:
+                    done_chunks[a] = _normalize(raw)
+
+        # 依區段起日串回去，順序與逐段查詢時相同
+        rows_all: List[Dict] = [r for a in sorted(done_chunks) for r in done_chunks[a]]
+
+        # 以「日期|時間|主旨|連結」字串當 key，保留第一次出現的那筆
+        dedup: Dict[str, Dict] = {}
         for r in rows_all:
-            key = (r.get("日期"), r.get("時間"), r.get("主旨"), r.get("連結"))
-            if key in seen: continue
-            seen.add(key); rows.append(r)
+            key = f"{r['日期']}|{r['時間']}|{r['主旨']}|{r['連結']}"
+            if key not in dedup:
+                dedup[key] = r
+        rows = list(dedup.values())
 
     rows.sort(key=lambda r: ((r.get("日期") or ""), (r.get("時間") or "")))
     return rows
\ No newline at end of file
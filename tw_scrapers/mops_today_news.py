@@ -1,37 +1,46 @@
 """抓取「公開資訊觀測站」當日重大訊息（上市/上櫃），支援關鍵字過濾。"""
 
 import re
-import requests
+import orjson
 from datetime import datetime, timezone, timedelta
+from functools import lru_cache
 from typing import List, Dict, Any
 
+from ._http import SESSION
+
 API = "https://openapi.twse.com.tw/v1/opendata/t187ap04_L"
 
 def _http_json(url: str) -> List[Dict[str, Any]]:
     """使用 requests 抓取 JSON 資料，失敗時拋出例外。"""
     try:
-        resp = requests.get(url, timeout=15, verify=False)
+        resp = SESSION.get(url, timeout=15, verify=False)
         resp.raise_for_status()
-        return resp.json()
+        return orjson.loads(resp.content)  # 直接解析 bytes，不用先解碼成字串
     except Exception as e:
         raise RuntimeError(f"HTTP JSON fetch failed: {e}")
 
-def _today_tokens_tpe() -> set[str]:
-    """產生當天可能出現的日期格式 Token，用於過濾資料日期。"""
-    tz = timezone(timedelta(hours=8))
-    now = datetime.now(tz)
-    y, m, d = now.year, now.month, now.day
+_TPE = timezone(timedelta(hours=8))
+
+@lru_cache(maxsize=2)
+def _date_tokens(y: int, m: int, d: int) -> frozenset[str]:
+    """某一天可能出現的日期格式 Token（民國/西元，含斜線與純數字）；同一天只算一次。"""
     roc_slash = f"{y-1911:03d}/{m:02d}/{d:02d}"
     roc_comp  = f"{y-1911:03d}{m:02d}{d:02d}"
     iso_slash = f"{y:04d}/{m:02d}/{d:02d}"
     iso_comp  = f"{y:04d}{m:02d}{d:02d}"
-    tokens = {roc_slash, roc_comp, iso_slash, iso_comp}
-    tokens |= {re.sub(r"\D", "", t) for t in tokens}
-    return tokens
+    # 純數字版本就是 *_comp，不用再拿正規表示式去掉斜線
+    return frozenset((roc_slash, roc_comp, iso_slash, iso_comp))
+
+def _today_tokens_tpe() -> frozenset[str]:
+    """產生當天可能出現的日期格式 Token，用於過濾資料日期。"""
+    now = datetime.now(_TPE)
+    return _date_tokens(now.year, now.month, now.day)
+
+_NON_DIGIT = re.compile(r"\D")
 
 def _compact(s: str | None) -> str | None:
     """將日期字串中的非數字移除。"""
-    return re.sub(r"\D", "", s.strip()) if s else None
+    return _NON_DIGIT.sub("", s) if s else None
 
 def fetch_today_major_announcements(keyword: str = "") -> list[dict]:
     """
@@ -55,11 +64,11 @@ def fetch_today_major_announcements(keyword: str = "") -> list[dict]:
         date_pub = row.get("出表日期") or row.get("公告日期") or row.get("date")
         date_say = row.get("發言日期") or row.get("日期")
         date_any = row.get("事實發生日") or row.get("發生日")
-        dates = [date_pub, date_say, date_any]
 
+        # 任一日期是今天就保留；原字串直接命中時就不用再去掉非數字
         if not any(
-            (d and d.strip() in today_tokens) or (_compact(d) in today_tokens)
-            for d in dates
+            d and (d in today_tokens or _compact(d) in today_tokens)
+            for d in (date_pub, date_say, date_any)
         ):
             continue
 
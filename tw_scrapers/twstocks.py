@@ -1,7 +1,11 @@
-import csv, io, requests
+import codecs, csv, io, os, tempfile, time
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
+import orjson
 import urllib3
 
+from ._http import SESSION
+
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 # --- 資料來源定義 ---
@@ -10,68 +14,150 @@ MOPS_CSV_L = "https://mopsfin.twse.com.tw/opendata/t187ap03_L.csv"
 MOPS_CSV_O = "https://mopsfin.twse.com.tw/opendata/t187ap03_O.csv"
 MOPS_CSV_R = "https://mopsfin.twse.com.tw/opendata/t187ap03_R.csv"
 
+# --- 本機快取：整理好的股票清單存成 JSON，啟動時載回再建索引，不用重抓、重解析 CSV ---
+# 不用 pickle：/tmp 誰都能寫，載入別人放的 pickle 等於替他執行程式碼
+CACHE_PATH = "/tmp/twstocks.json"
+CACHE_TTL_SECONDS = 86400
+
 # --- 資料解析 ---
 def _parse_csv_bytes(b: bytes) -> List[Dict[str, str]]:
-    text = b.decode("utf-8-sig", errors="ignore")
-    sio = io.StringIO(text)
-    rdr = csv.DictReader(sio)
+    # 逐行解碼餵給 csv.reader，不必先把整份 bytes 轉成一個大字串
+    rdr = csv.reader(codecs.iterdecode(io.BytesIO(b), "utf-8-sig", errors="ignore"))
+    header = next(rdr, None)
+    if not header or "公司代號" not in header or "公司名稱" not in header:
+        return []
+    # 直接用欄位位置取值，不用每列建一個 dict
+    i_code, i_name = header.index("公司代號"), header.index("公司名稱")
+    i_short = header.index("公司簡稱") if "公司簡稱" in header else None
+    width = max(i_code, i_name) + 1
     out = []
     for r in rdr:
-        code = (r.get("公司代號") or "").strip().replace("/", "")
-        name = (r.get("公司名稱") or "").strip()
-        short = (r.get("公司簡稱") or "").strip()
-        if code.isdigit() and 4 <= len(code) <= 5 and name:
+        if len(r) < width:
+            continue
+        code = r[i_code].strip().replace("/", "")
+        if not (code.isdigit() and 4 <= len(code) <= 5):
+            continue
+        name = r[i_name].strip()
+        if name:
+            short = r[i_short].strip() if i_short is not None and i_short < len(r) else ""
             out.append({"code": code, "name": name, "short": short})
     return out
 
+_NAME_SUFFIXES = ("股份有限公司", "有限公司")
+
 def _clean_name(s: str) -> str:
-    return s.rstrip("股份有限公司有限公司").strip() if s else s
+    """去掉公司名稱結尾的『股份有限公司』或『有限公司』（整段比對，不是逐字剝除）。"""
+    if not s:
+        return s
+    for suffix in _NAME_SUFFIXES:
+        if s.endswith(suffix):
+            return s[:-len(suffix)].strip()
+    return s.strip()
 
 # --- 資料抓取 ---
-def _fetch_all_sources() -> List[Dict[str, str]]:
+SOURCES = [TWSE_JSON_L, MOPS_CSV_L, MOPS_CSV_O, MOPS_CSV_R]
+
+def _fetch_one(url: str) -> List[Dict[str, str]]:
     items = []
-    for url in [TWSE_JSON_L, MOPS_CSV_L, MOPS_CSV_O, MOPS_CSV_R]:
-        try:
-            resp = requests.get(url, timeout=10, verify=False)
-            resp.raise_for_status()
-
-            if url.endswith(".json"):
-                data = resp.json()
-                if isinstance(data, list):
-                    for x in data:
-                        code = (x.get("公司代號") or "").strip()
-                        name = (x.get("公司名稱") or "").strip()
-                        short = (x.get("公司簡稱") or "").strip()
-                        if code and name:
-                            items.append({"code": code, "name": name, "short": short})
-            else:
-                items.extend(_parse_csv_bytes(resp.content))
+    try:
+        resp = SESSION.get(url, timeout=10, verify=False)
+        resp.raise_for_status()
 
-        except Exception as e:
-            print(f"[資料抓取失敗] {url}：{e}")
-            continue
+        if url.endswith(".json"):
+            data = resp.json()
+            if isinstance(data, list):
+                for x in data:
+                    code = (x.get("公司代號") or "").strip()
+                    name = (x.get("公司名稱") or "").strip()
+                    short = (x.get("公司簡稱") or "").strip()
+                    if code and name:
+                        items.append({"code": code, "name": name, "short": short})
+        else:
+            items.extend(_parse_csv_bytes(resp.content))
+
+    except Exception as e:
+        print(f"[資料抓取失敗] {url}：{e}")
+    return items
+
+def _fetch_all_sources() -> List[Dict[str, str]]:
+    # 四個來源同時抓，總耗時約等於最慢的那一個；map 保持來源順序，後面的來源覆蓋前面的
+    with ThreadPoolExecutor(max_workers=len(SOURCES)) as pool:
+        items = [x for batch in pool.map(_fetch_one, SOURCES) for x in batch]
 
     dedup = {x["code"]: x for x in items if x.get("code")}
     return sorted(dedup.values(), key=lambda x: x["code"])
 
+def _load_cache() -> Optional[List[Dict[str, str]]]:
+    """讀回沒過期的本機快取（整理好的股票清單）；沒有、過期或格式不符回傳 None。"""
+    try:
+        if time.time() - os.path.getmtime(CACHE_PATH) > CACHE_TTL_SECONDS:
+            return None
+        with open(CACHE_PATH, "rb") as f:
+            items = orjson.loads(f.read())
+    except Exception:
+        return None
+    if not isinstance(items, list) or not all(
+        isinstance(x, dict) and isinstance(x.get("code"), str) and isinstance(x.get("name"), str)
+        for x in items
+    ):
+        return None  # 格式不符（舊版或被改過）時當作沒有
+    return items
+
+def _bigrams(s: str) -> set[str]:
+    return {s[i:i + 2] for i in range(len(s) - 1)}
+
+def _save_cache(items: List[Dict[str, str]]):
+    try:
+        # 暫存檔用 mkstemp 建，檔名猜不到，也不會跟著別人預先放好的 symlink 寫出去
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(CACHE_PATH), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(orjson.dumps(items))
+        os.replace(tmp, CACHE_PATH)
+    except OSError as e:
+        print(f"[股票清單快取寫入失敗] {e}")
+
 # --- 主類別 ---
 class TwStock:
     def __init__(self):
         self.all_items = []
         self.code2item = {}
         self.name2code = {}
+        self.short2code = {}
+        self.bigram_idx = {}  # 名稱或簡稱裡的每個兩字片段 → 含有它的代號
         self.source = None
-        self.refresh(force=True)
+        self.refresh()
 
     def _apply_items(self, items: List[Dict[str, str]]):
         self.all_items = items
         self.code2item = {x["code"]: x for x in items}
         self.name2code = {x["name"]: x["code"] for x in items}
+        self.short2code = {}
+        for x in items:
+            if x.get("short"):
+                self.short2code.setdefault(x["short"], x["code"])  # 簡稱重覆時保留清單中第一檔
+        self.bigram_idx = {}
+        for x in items:
+            for g in _bigrams(x["name"]) | _bigrams(x.get("short", "")):
+                self.bigram_idx.setdefault(g, set()).add(x["code"])
 
-    def refresh(self, force: bool = False):
+    def refresh(self, force: bool = False) -> bool:
+        """載入股票清單；force=False 時優先用沒過期的本機快取，force=True 一律重抓。
+
+        全部來源都失敗（抓回空清單）時保留原本的清單，回傳 False；成功載入回傳 True。
+        """
+        cached = None if force else _load_cache()
+        if cached:
+            self._apply_items(cached)
+            self.source = "cache"
+            return True
         items = _fetch_all_sources()
+        if not items:
+            print("[股票清單] 所有來源都抓不到資料，沿用原本的清單")
+            return False
         self._apply_items(items)
         self.source = "network"
+        _save_cache(items)
+        return True
 
     def get_name(self, code: str, clean: bool = True, prefer_short: bool = True) -> Optional[str]:
         it = self.code2item.get(code)
@@ -82,6 +168,16 @@ class TwStock:
     def get_code(self, name: str) -> Optional[str]:
         return self.name2code.get(name)
 
+    def _name_candidates(self, q: str) -> List[Dict[str, str]]:
+        """用兩字片段索引縮小範圍：名稱含 q 就一定含 q 的每個兩字片段。依代號排序（同 all_items）。"""
+        if len(q) < 2:
+            return self.all_items
+        sets = sorted((self.bigram_idx.get(g, ()) for g in _bigrams(q)), key=len)
+        if not sets[0]:
+            return []
+        codes = set(sets[0]).intersection(*sets[1:])
+        return [self.code2item[c] for c in sorted(codes)]
+
     def search_by_name(self, substr: str, clean: bool = True) -> List[Dict[str, str]]:
         q = substr.strip()
         return [
@@ -91,7 +187,7 @@ class TwStock:
                 "short": it["short"],
                 "clean_name": _clean_name(it["name"]) if clean else it["name"]
             }
-            for it in self.all_items
+            for it in self._name_candidates(q)
             if q and (q in it["name"] or q in it.get("short", ""))
         ]
 
@@ -99,7 +195,7 @@ class TwStock:
         """查即時股價 API 取得代號對應名稱（含 ETF）"""
         url = f"https://mis.twse.com.tw/stock/api/getStockInfo.jsp?ex_ch=tse_{stock_code}.tw"
         try:
-            res = requests.get(url, timeout=5,verify=False)
+            res = SESSION.get(url, timeout=5, verify=False)
             data = res.json()
             if "msgArray" in data and data["msgArray"]:
                 return data["msgArray"][0]["n"]